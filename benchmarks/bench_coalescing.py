@@ -0,0 +1,89 @@
+"""
+Measure how coalescing bursts of user messages changes run count and latency.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_coalescing --users 30 --burst 3 --window 1.0
+
+Each synthetic user sends bursts of short messages a fraction of a second apart.
+Messages go through ConversationScheduler into a handler that does what
+HeliusChatBot.process_user_message does against the fake Assistants API: add
+the messages, create one run and wait for it with RunDriver. A message's
+latency runs from when it was sent to when the reply covering it is ready.
+"""
+import argparse
+import asyncio
+import json
+import random
+
+from benchmarks.fake_openai import FakeAssistantsAPI
+from utils.run_engine import RunDriver
+from utils.scheduler import ConversationScheduler, percentile
+
+
+async def simulate(args, window):
+    scale = args.scale
+    api = FakeAssistantsAPI(median_latency=args.median_latency, request_latency=0.15, scale=scale, seed=7)
+    driver = RunDriver(api, initial_interval=0.1 * scale, max_interval=2.0 * scale)
+    loop = asyncio.get_running_loop()
+    latencies = []
+
+    async def handler(thread_id, sent_times):
+        for _ in sent_times:
+            await api.beta.threads.messages.create(thread_id=thread_id, role="user", content="hi")
+        run = await api.beta.threads.runs.create(thread_id=thread_id, assistant_id="asst_bench")
+        await driver.wait(thread_id, run.id)
+        await api.beta.threads.messages.list(thread_id=thread_id)
+        replied = loop.time()
+        latencies.extend((replied - sent) / scale for sent in sent_times)
+
+    scheduler = ConversationScheduler(handler, asyncio.Semaphore(50), idle_timeout=60,
+                                      coalesce_window=window * scale, coalesce_max_wait=4 * scale)
+    rng = random.Random(11)
+
+    async def user(index):
+        thread_id = f"thread_{index}"
+        await asyncio.sleep(rng.uniform(0, 2) * scale)
+        for _ in range(args.bursts):
+            for _ in range(args.burst):
+                scheduler.submit(thread_id, loop.time())
+                await asyncio.sleep(rng.uniform(0.2, 0.8) * scale)
+            await asyncio.sleep(rng.uniform(8, 15) * scale)
+
+    await asyncio.gather(*(user(i) for i in range(args.users)))
+    while scheduler.queue_depth() or len(latencies) < args.users * args.bursts * args.burst:
+        await asyncio.sleep(0.01)
+    await scheduler.close()
+    return {
+        "messages": len(latencies),
+        "runs": api.runs_created,
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=30)
+    parser.add_argument("--bursts", type=int, default=2, help="bursts per user")
+    parser.add_argument("--burst", type=int, default=3, help="messages per burst")
+    parser.add_argument("--window", type=float, default=1.0, help="coalesce window to compare (s)")
+    parser.add_argument("--median-latency", type=float, default=3.0, help="median simulated model time (s)")
+    parser.add_argument("--scale", type=float, default=0.05, help="time compression factor")
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    results = {
+        "no_coalescing": await simulate(args, 0),
+        f"window_{args.window:g}s": await simulate(args, args.window),
+    }
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'mode':<16}{'messages':>9}{'runs':>6}{'p50':>8}{'p95':>8}{'p99':>8}")
+    for name, r in results.items():
+        print(f"{name:<16}{r['messages']:>9}{r['runs']:>6}{r['p50']:>8.2f}{r['p95']:>8.2f}{r['p99']:>8.2f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
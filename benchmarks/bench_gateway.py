@@ -0,0 +1,217 @@
+"""
+Replay gateway traffic through the bot's connection state under each gateway profile
+and compare resident memory and CPU.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_gateway --guilds 20 --members 5000 --events 200000
+    python -m benchmarks.bench_gateway --replay gateway.jsonl
+
+--replay takes recorded dispatch frames, one {"t": event, "d": payload} JSON object
+per line (GUILD_CREATE frames first). Without it a large-server workload is
+synthesised: guilds with many members and channels, then a stream of presence
+updates, typing, member updates and messages in mostly unserved channels.
+
+Each profile runs in a fresh subprocess. Frames go straight into the parsers of
+a HeliusBot built with that profile's options, as the websocket would feed them;
+frames for intents the profile doesn't request are skipped, since Discord would
+never send them. Reports RSS growth, CPU seconds, events per CPU second and
+the number of events dropped early.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+
+# Which intent Discord requires before it sends an event
+EVENT_INTENTS = {
+    "PRESENCE_UPDATE": "presences",
+    "TYPING_START": "guild_typing",
+    "GUILD_MEMBER_ADD": "members",
+    "GUILD_MEMBER_UPDATE": "members",
+    "GUILD_MEMBER_REMOVE": "members",
+    "MESSAGE_CREATE": "guild_messages",
+    "MESSAGE_UPDATE": "guild_messages",
+    "MESSAGE_DELETE": "guild_messages",
+}
+SERVED_CHANNELS = 3
+
+
+def current_rss_mb():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def snowflake(n):
+    return str(10**17 + n)
+
+
+def user_payload(user_id):
+    return {"id": snowflake(user_id), "username": f"user{user_id}", "discriminator": "0",
+            "avatar": None, "global_name": None}
+
+
+def synthesize(args):
+    """Frames for --guilds large guilds followed by --events mixed events."""
+    rng = random.Random(args.seed)
+    frames = []
+    channels = []
+    for guild in range(args.guilds):
+        guild_id = snowflake(1_000_000 + guild)
+        guild_channels = [snowflake(2_000_000 + guild * args.channels + index) for index in range(args.channels)]
+        channels.extend((guild_id, channel_id) for channel_id in guild_channels)
+        members = [{"user": user_payload(guild * args.members + index), "roles": [], "joined_at": "2023-01-01T00:00:00+00:00",
+                    "deaf": False, "mute": False} for index in range(args.members)]
+        presences = [{"user": {"id": member["user"]["id"]}, "status": "online", "activities": [],
+                      "client_status": {"desktop": "online"}} for member in members[::3]]
+        frames.append({"t": "GUILD_CREATE", "d": {
+            "id": guild_id, "name": f"Guild {guild}", "owner_id": members[0]["user"]["id"], "roles": [],
+            "emojis": [], "stickers": [], "features": [], "member_count": args.members, "large": True,
+            "channels": [{"id": channel_id, "type": 0, "name": f"chan-{index}", "position": index,
+                          "guild_id": guild_id, "permission_overwrites": []}
+                         for index, channel_id in enumerate(guild_channels)],
+            "members": members, "presences": presences, "voice_states": [], "threads": [],
+        }})
+
+    served = [channel_id for _, channel_id in channels[:SERVED_CHANNELS]]
+    for index in range(args.events):
+        guild_id, channel_id = rng.choice(channels)
+        if rng.random() < args.served_fraction:
+            channel_id = rng.choice(served)
+            guild_id = channels[0][0]
+        user = user_payload(rng.randrange(args.guilds * args.members))
+        kind = rng.random()
+        if kind < 0.55:
+            frames.append({"t": "PRESENCE_UPDATE", "d": {
+                "user": {"id": user["id"]}, "guild_id": guild_id, "status": rng.choice(["online", "idle", "dnd"]),
+                "activities": [{"name": "a game", "type": 0}], "client_status": {"desktop": "online"}}})
+        elif kind < 0.70:
+            frames.append({"t": "TYPING_START", "d": {
+                "channel_id": channel_id, "guild_id": guild_id, "user_id": user["id"], "timestamp": int(time.time()),
+                "member": {"user": user, "roles": [], "joined_at": "2023-01-01T00:00:00+00:00", "deaf": False, "mute": False}}})
+        elif kind < 0.75:
+            frames.append({"t": "GUILD_MEMBER_UPDATE", "d": {
+                "guild_id": guild_id, "user": user, "roles": [], "nick": f"nick{index}",
+                "joined_at": "2023-01-01T00:00:00+00:00"}})
+        else:
+            frames.append({"t": "MESSAGE_CREATE", "d": {
+                "id": snowflake(50_000_000 + index), "channel_id": channel_id, "guild_id": guild_id, "author": user,
+                "member": {"roles": [], "joined_at": "2023-01-01T00:00:00+00:00", "deaf": False, "mute": False},
+                "content": "gm " * rng.randint(1, 40), "timestamp": "2024-01-01T00:00:00+00:00",
+                "edited_timestamp": None, "tts": False, "mention_everyone": False, "mentions": [],
+                "mention_roles": [], "attachments": [], "embeds": [], "pinned": False, "type": 0}})
+    return frames, {int(channel_id) for channel_id in served}
+
+
+def load_replay(path):
+    with open(path) as f:
+        frames = [json.loads(line) for line in f if line.strip()]
+    # Serve the channels of the first few messages, like a bot answering in a handful of channels
+    served = []
+    for frame in frames:
+        if frame["t"] == "MESSAGE_CREATE" and frame["d"]["channel_id"] not in served:
+            served.append(frame["d"]["channel_id"])
+    return frames, {int(channel_id) for channel_id in served[:SERVED_CHANNELS]}
+
+
+async def replay(args):
+    from nextcord import ClientUser
+
+    from main import HeliusBot
+    from utils.gateway_profile import dropped_events, gateway_options
+
+    frames, served = load_replay(args.replay) if args.replay else synthesize(args)
+    options = gateway_options(args.profile)
+    intents = options["intents"]
+    frames = [frame for frame in frames if getattr(intents, EVENT_INTENTS.get(frame["t"], "guilds"))]
+    if not intents.members:
+        for frame in frames:
+            if frame["t"] == "GUILD_CREATE":
+                # Without member/presence intents Discord leaves these out of GUILD_CREATE
+                frame["d"] = {**frame["d"], "members": [], "presences": []}
+
+    options["chunk_guilds_at_startup"] = False  # There is no gateway to chunk from
+    # The connection state, its parsers and message cache are nextcord internals (checked against 2.6.0)
+    bot = HeliusBot(command_prefix="!", help_command=None, drop_unserved_events=args.profile == "lean", **options)
+    bot.served_channel_ids = served
+    state = bot._connection
+    state.user = ClientUser(state=state, data={**user_payload(0), "bot": True, "verified": True,
+                                              "mfa_enabled": False, "flags": 0})
+    parsers = state.parsers
+
+    if args.tracemalloc:
+        tracemalloc.start()
+    rss_before = current_rss_mb()
+    cpu_before = time.process_time()
+    started = time.perf_counter()
+    for index, frame in enumerate(frames):
+        parse = parsers.get(frame["t"])
+        if parse is not None:
+            parse(frame["d"])
+        if index % 1000 == 0:
+            await asyncio.sleep(0)  # Let dispatched listeners run, as the real loop would
+    await asyncio.sleep(0)
+    cpu = time.process_time() - cpu_before
+    results = {
+        "profile": args.profile,
+        "events": len(frames),
+        "dropped_early": sum(dropped_events.values()),
+        "cpu_seconds": cpu,
+        "wall_seconds": time.perf_counter() - started,
+        "events_per_cpu_second": len(frames) / cpu if cpu else None,
+        "rss_growth_mb": current_rss_mb() - rss_before,
+        "cached_messages": len(state._messages or ()),
+        "cached_members": sum(len(guild.members) for guild in bot.guilds),
+    }
+    if args.tracemalloc:
+        results["heap_peak_mb"] = tracemalloc.get_traced_memory()[1] / 2**20
+    return results
+
+
+def run_profile(profile, argv):
+    command = [sys.executable, "-m", "benchmarks.bench_gateway", "--child", profile, *argv]
+    output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--replay", help="JSONL file of recorded dispatch frames")
+    parser.add_argument("--guilds", type=int, default=10)
+    parser.add_argument("--members", type=int, default=5000, help="members per synthetic guild")
+    parser.add_argument("--channels", type=int, default=50, help="channels per synthetic guild")
+    parser.add_argument("--events", type=int, default=100000)
+    parser.add_argument("--served-fraction", type=float, default=0.02, help="share of events in served channels")
+    parser.add_argument("--seed", type=int, default=5)
+    parser.add_argument("--tracemalloc", action="store_true", help="also report the Python heap peak")
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    parser.add_argument("--child", choices=("full", "lean"), help=argparse.SUPPRESS)
+    args, _ = parser.parse_known_args()
+
+    if args.child:
+        args.profile = args.child
+        print(json.dumps(asyncio.run(replay(args))))
+        return
+
+    argv = [arg for arg in sys.argv[1:] if arg != "--json"]
+    results = {profile: run_profile(profile, argv) for profile in ("full", "lean")}
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    keys = [key for key in results["full"] if key != "profile"]
+    print(f"{'':<24}{'full':>14}{'lean':>14}")
+    for key in keys:
+        row = [results[profile].get(key) for profile in ("full", "lean")]
+        print(f"{key:<24}" + "".join(f"{value:>14.2f}" if isinstance(value, float) else f"{value!s:>14}" for value in row))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+"""
+End-to-end load test of the real message path against local fake upstreams.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_load --users 200 --rate 20 --duration 60
+    python -m benchmarks.bench_load --json > before.json
+    python -m benchmarks.bench_load --baseline before.json
+
+Starts benchmarks.fake_upstreams in a subprocess and points the OpenAI client,
+CoinMarketCap, CoinGecko, Wolfram Alpha, MediaWiki and arXiv at it, then loads
+the real HeliusChatBot cog with a stand-in bot and channels. Synthetic users
+mention the bot with Poisson arrivals, so messages run through on_message, the
+conversation scheduler, the run driver, the tool executor and the outbound
+sender exactly as in production; only Discord and the upstream servers are fake.
+
+Reports throughput, end-to-end reply latency (message sent to reply finished),
+time to first visible token (message sent to first text shown), error replies
+and the process's peak RSS. With --baseline the run is compared against an
+earlier --json result.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+from benchmarks.fake_upstreams import upstream_env
+from utils.metrics import FIRST_TOKEN_SECONDS
+from utils.scheduler import percentile
+
+_message_ids = itertools.count(1)
+
+
+class FakeUser:
+    def __init__(self, user_id, bot=False):
+        self.id = user_id
+        self.bot = bot
+
+    def __str__(self):
+        return f"user{self.id}"
+
+
+class FakeMessage:
+    def __init__(self, channel, author=None, content="", mentions=()):
+        self.id = next(_message_ids)
+        self.channel = channel
+        self.author = author
+        self.content = content
+        self.mentions = list(mentions)
+        self.reference = None
+        self.sent_at = time.perf_counter()
+        self.created_at = datetime.now(timezone.utc)
+
+    async def edit(self, content):
+        self.content = content
+        self.channel.edits += 1
+        return self
+
+
+class FakeTyping:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+
+class FakeChannel:
+    def __init__(self, channel_id):
+        self.id = channel_id
+        self.sent = []
+        self.edits = 0
+
+    def typing(self):
+        return FakeTyping()
+
+    async def send(self, content):
+        message = FakeMessage(self, content=content)
+        self.sent.append(message)
+        return message
+
+
+class FakeBot:
+    def __init__(self):
+        self.user = FakeUser(0, bot=True)
+
+
+def start_upstreams(args):
+    command = [sys.executable, "-m", "benchmarks.fake_upstreams", "--latency", args.latency,
+               "--model-median", str(args.model_median), "--tool-probability", str(args.tool_probability),
+               "--reply-chars", str(args.reply_chars)]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    line = process.stdout.readline()
+    if not line.startswith("READY"):
+        process.kill()
+        raise RuntimeError(f"Fake upstreams failed to start: {line!r}")
+    return process, int(line.split()[1])
+
+
+async def run_load(args, port):
+    workdir = tempfile.mkdtemp(prefix="helius-bench-")
+    os.environ.update(upstream_env(f"http://127.0.0.1:{port}"))
+    os.environ.update({
+        "OPENAI_API_KEY": "sk-bench",
+        "ASSISTANT_ID": "asst_bench",
+        "WOLFRAM_ID": "bench",
+        "CMC_API_KEY": "bench",
+        "USER_DB_PATH": os.path.join(workdir, "user_threads.db"),
+        "STREAM_REPLIES": "1" if args.stream else "0",
+        "STREAM_EDIT_INTERVAL": str(args.edit_interval),
+        "TOOL_CACHE_SIZE": str(args.tool_cache_size),
+    })
+    # Configuration is read at import time, so import after the environment is set
+    from cogs import assistant
+    from database import user_database
+    from utils.cache import tool_cache
+    from utils.http_clients import close_http_clients
+    from utils.openai_client import close_openai_client
+
+    await user_database.connect()
+    bot = FakeBot()
+    cog = assistant.HeliusChatBot(bot)
+    channels = [FakeChannel(10_000 + index) for index in range(args.channels)]
+    cog.allowed_channel_ids = {channel.id for channel in channels}
+
+    latencies = []
+    handler = cog.scheduler.handler
+
+    async def timed_handler(user_id, messages):
+        await handler(user_id, messages)
+        done = time.perf_counter()
+        latencies.extend(done - message.sent_at for message in messages)
+
+    cog.scheduler.handler = timed_handler
+
+    rng = random.Random(args.seed)
+    users = [FakeUser(index + 1) for index in range(args.users)]
+    total = int(args.rate * args.duration)
+    started = time.perf_counter()
+    for _ in range(total):
+        await asyncio.sleep(rng.expovariate(args.rate))
+        user = rng.choice(users)
+        channel = channels[user.id % len(channels)]
+        await cog.on_message(FakeMessage(channel, user, "What's the price of BTC today?", mentions=[bot.user]))
+    deadline = time.perf_counter() + args.drain_timeout
+    while len(latencies) < total and time.perf_counter() < deadline:
+        await asyncio.sleep(0.05)
+    elapsed = time.perf_counter() - started
+
+    await cog.scheduler.close()
+    await user_database.close()
+    await close_http_clients()
+    await close_openai_client()
+    await tool_cache.close()
+
+    ttft = FIRST_TOKEN_SECONDS._series.get((), None)
+    errors = sum(message.content.startswith("Sorry") for channel in channels for message in channel.sent)
+    return {
+        "messages": total,
+        "replied": len(latencies),
+        "errors": errors,
+        "throughput": len(latencies) / elapsed,
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+        "mean_ttft": ttft[-2] / ttft[-1] if ttft and ttft[-1] else None,
+        "edits": sum(channel.edits for channel in channels),
+        "throttled_sends": cog.sender.throttled,
+        "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def print_results(results, baseline=None):
+    for key, value in results.items():
+        line = f"{key:<16}{value:>12.3f}" if isinstance(value, float) else f"{key:<16}{value!s:>12}"
+        previous = (baseline or {}).get(key)
+        if isinstance(value, (int, float)) and isinstance(previous, (int, float)) and previous:
+            line += f"   baseline {previous:>10.3f}  ({(value - previous) / previous:+.1%})"
+        print(line)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--channels", type=int, default=50, help="users are spread over this many channels")
+    parser.add_argument("--rate", type=float, default=10.0, help="messages per second (Poisson arrivals)")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds of arrivals")
+    parser.add_argument("--drain-timeout", type=float, default=120.0, help="seconds to wait for outstanding replies")
+    parser.add_argument("--latency", default="", help="per-upstream latency, e.g. openai=0.05,cmc=0.2")
+    parser.add_argument("--model-median", type=float, default=2.0, help="median model time per run segment (s)")
+    parser.add_argument("--tool-probability", type=float, default=0.4)
+    parser.add_argument("--reply-chars", type=int, default=600)
+    parser.add_argument("--no-stream", dest="stream", action="store_false", help="poll runs instead of streaming")
+    parser.add_argument("--edit-interval", type=float, default=1.2)
+    parser.add_argument("--tool-cache-size", type=int, default=2048, help="0 disables caching hits")
+    parser.add_argument("--tracemalloc", action="store_true", help="also report the Python heap peak")
+    parser.add_argument("--seed", type=int, default=3)
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare against")
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    if args.tracemalloc:
+        tracemalloc.start()
+    process, port = start_upstreams(args)
+    try:
+        results = await run_load(args, port)
+    finally:
+        process.terminate()
+        process.wait()
+    if args.tracemalloc:
+        results["heap_peak_mb"] = tracemalloc.get_traced_memory()[1] / 2**20
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,100 @@
+"""
+Compare reply latency of the old fixed 4 s `wait_on_run` loop with `RunDriver`,
+both polling and consuming the run event stream.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_run_latency --runs 200 --scale 0.05
+
+All simulated durations and poll intervals are multiplied by `--scale` so the
+benchmark finishes quickly; reported numbers are converted back to real seconds.
+"""
+import argparse
+import asyncio
+import json
+import statistics
+
+from benchmarks.fake_openai import FakeAssistantsAPI
+from utils.run_engine import RunDriver
+
+
+class LegacyDriver:
+    """The original `wait_on_run`: sleep `check_interval`, then retrieve, forever."""
+
+    def __init__(self, client, check_interval=4.0):
+        self.client = client
+        self.check_interval = check_interval
+
+    async def wait(self, thread_id, run_id):
+        while True:
+            await asyncio.sleep(self.check_interval)
+            run = await self.client.beta.threads.runs.retrieve(thread_id=thread_id, run_id=run_id)
+            if run.status in ["requires_action", "completed"]:
+                return run
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def measure(driver, api, runs, concurrency, scale, stream=False):
+    semaphore = asyncio.Semaphore(concurrency)
+    loop = asyncio.get_running_loop()
+    latencies, overheads = [], []
+
+    async def one_reply():
+        async with semaphore:
+            started = loop.time()
+            if stream:
+                async def on_text(delta):
+                    pass
+                run = await driver.create("thread_bench", "asst_bench", on_text=on_text)
+            else:
+                run = await api.beta.threads.runs.create(thread_id="thread_bench", assistant_id="asst_bench")
+                await driver.wait("thread_bench", run.id)
+            elapsed = (loop.time() - started) / scale
+            latencies.append(elapsed)
+            overheads.append(elapsed - api.model_time(run.id) / scale)
+
+    await asyncio.gather(*(one_reply() for _ in range(runs)))
+    return {
+        "p50": percentile(latencies, 50),
+        "p99": percentile(latencies, 99),
+        "mean": statistics.fmean(latencies),
+        "overhead_p50": percentile(overheads, 50),
+        "overhead_p99": percentile(overheads, 99),
+        "retrieve_calls_per_run": api.retrieve_calls / runs,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--median-latency", type=float, default=1.5, help="median simulated model time (s)")
+    parser.add_argument("--scale", type=float, default=0.05, help="time compression factor")
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    results = {}
+    for name in ("legacy", "run_driver", "run_stream"):
+        api = FakeAssistantsAPI(median_latency=args.median_latency, scale=args.scale, seed=42)
+        if name == "legacy":
+            driver = LegacyDriver(api, check_interval=4.0 * args.scale)
+        else:
+            driver = RunDriver(api, initial_interval=0.1 * args.scale, max_interval=2.0 * args.scale)
+        results[name] = await measure(driver, api, args.runs, args.concurrency, args.scale,
+                                      stream=name == "run_stream")
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'driver':<12}{'p50':>8}{'p99':>8}{'mean':>8}{'ovh p50':>10}{'ovh p99':>10}{'polls/run':>11}")
+    for name, r in results.items():
+        print(f"{name:<12}{r['p50']:>8.2f}{r['p99']:>8.2f}{r['mean']:>8.2f}"
+              f"{r['overhead_p50']:>10.2f}{r['overhead_p99']:>10.2f}{r['retrieve_calls_per_run']:>11.1f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,62 @@
+"""
+Measure cold-start import time and resident memory of the assistant cog with lazy
+tool loading versus importing every tool module up front.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_startup --repeat 5
+
+Each sample runs in a fresh interpreter. 'lazy' imports cogs.assistant as the bot
+does at start-up; 'eager' additionally imports every module in the tool registry,
+which is what loading the cog cost before tools were loaded on first call (and
+what prewarming does in the background after on_ready).
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+CHILD = """
+import json, os, sys, time
+started = time.perf_counter()
+import cogs.assistant
+if sys.argv[1] == "eager":
+    import importlib
+    for tool in cogs.assistant.tool_registry.tools.values():
+        importlib.import_module(tool.spec.module)
+elapsed = time.perf_counter() - started
+with open("/proc/self/statm") as f:
+    rss = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+print(json.dumps({"import_seconds": elapsed, "rss_mb": rss, "modules": len(sys.modules)}))
+"""
+
+
+def sample(mode):
+    env = {**os.environ, "OPENAI_API_KEY": os.getenv("OPENAI_API_KEY", "sk-bench"),
+           "ASSISTANT_ID": os.getenv("ASSISTANT_ID", "asst_bench")}
+    output = subprocess.run([sys.executable, "-c", CHILD, mode], check=True, capture_output=True,
+                            text=True, env=env).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5, help="fresh interpreters per mode")
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    results = {}
+    for mode in ("eager", "lazy"):
+        samples = [sample(mode) for _ in range(args.repeat)]
+        results[mode] = {key: statistics.median(s[key] for s in samples) for key in samples[0]}
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'mode':<8}{'import s':>10}{'RSS MB':>10}{'modules':>10}")
+    for mode, r in results.items():
+        print(f"{mode:<8}{r['import_seconds']:>10.2f}{r['rss_mb']:>10.1f}{r['modules']:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+In-process stand-in for the parts of the Assistants API the bot uses.
+
+Runs "think" for a simulated model time drawn from a log-normal distribution and
+report `in_progress` until that time has elapsed, so a run driver can be measured
+against real model latency without touching the network.
+"""
+import asyncio
+import itertools
+import random
+import time
+from types import SimpleNamespace
+
+
+class FakeEventStream:
+    """Emits Assistants stream events: run created, text deltas, then run completed."""
+
+    def __init__(self, api, run, chunks=8):
+        self.api = api
+        self.run = run
+        self.chunks = chunks
+
+    def _event(self, name, data):
+        return SimpleNamespace(event=name, data=data)
+
+    async def __aiter__(self):
+        yield self._event("thread.run.created", self.run)
+        remaining = self.api.runs[self.run.id]["ready_at"] - time.monotonic()
+        # Tokens start arriving a third of the way in and keep coming until the run ends
+        await asyncio.sleep(max(0.0, remaining / 3))
+        for _ in range(self.chunks):
+            text = SimpleNamespace(value="word " * 5)
+            part = SimpleNamespace(type="text", text=text)
+            yield self._event("thread.message.delta", SimpleNamespace(delta=SimpleNamespace(content=[part])))
+            await asyncio.sleep(max(0.0, remaining * 2 / 3 / self.chunks))
+        yield self._event("thread.run.completed", self.api.run_state(self.run.id))
+
+    async def close(self):
+        pass
+
+
+class FakeRuns:
+    def __init__(self, api):
+        self.api = api
+
+    async def create(self, thread_id, assistant_id, stream=False, **kwargs):
+        await self.api.round_trip()
+        self.api.runs_created += 1
+        run = self.api.start_run(thread_id)
+        return FakeEventStream(self.api, run) if stream else run
+
+    async def retrieve(self, thread_id, run_id):
+        await self.api.round_trip()
+        self.api.retrieve_calls += 1
+        return self.api.run_state(run_id)
+
+    async def submit_tool_outputs(self, thread_id, run_id, tool_outputs, **kwargs):
+        await self.api.round_trip()
+        return self.api.resume_run(run_id)
+
+
+class FakeMessages:
+    def __init__(self, api):
+        self.api = api
+
+    async def create(self, thread_id, role, content, **kwargs):
+        await self.api.round_trip()
+        return SimpleNamespace(id=f"msg_{next(self.api.ids)}", role=role)
+
+    async def list(self, thread_id, order="desc", limit=1, **kwargs):
+        await self.api.round_trip()
+        text = SimpleNamespace(value="Fake assistant reply.")
+        message = SimpleNamespace(role="assistant", content=[SimpleNamespace(text=text)])
+        return SimpleNamespace(data=[message])
+
+
+class FakeThreads:
+    def __init__(self, api):
+        self.api = api
+        self.runs = FakeRuns(api)
+        self.messages = FakeMessages(api)
+
+    async def create(self, **kwargs):
+        await self.api.round_trip()
+        return SimpleNamespace(id=f"thread_{next(self.api.ids)}")
+
+
+class FakeAssistantsAPI:
+    """
+    Async fake with the same call shape as `openai.AsyncOpenAI().beta.threads`.
+
+    - `median_latency`: median simulated model time per run segment, in seconds.
+    - `sigma`: log-normal spread; larger values give a heavier tail.
+    - `request_latency`: network round trip added to every API call, in seconds.
+    - `scale`: multiplies every simulated duration, so benchmarks can run faster than real time.
+    """
+
+    def __init__(self, median_latency=1.5, sigma=0.6, request_latency=0.0, scale=1.0, seed=0):
+        self.median_latency = median_latency
+        self.sigma = sigma
+        self.request_latency = request_latency
+        self.scale = scale
+        self.random = random.Random(seed)
+        self.ids = itertools.count(1)
+        self.runs = {}
+        self.retrieve_calls = 0
+        self.runs_created = 0
+        self.beta = SimpleNamespace(threads=FakeThreads(self))
+
+    async def round_trip(self):
+        if self.request_latency:
+            await asyncio.sleep(self.request_latency * self.scale)
+
+    def _model_time(self):
+        return self.random.lognormvariate(0, self.sigma) * self.median_latency * self.scale
+
+    def start_run(self, thread_id):
+        run_id = f"run_{next(self.ids)}"
+        duration = self._model_time()
+        self.runs[run_id] = {"ready_at": time.monotonic() + duration, "model_time": duration}
+        return SimpleNamespace(id=run_id, status="queued", thread_id=thread_id)
+
+    def resume_run(self, run_id):
+        duration = self._model_time()
+        state = self.runs[run_id]
+        state["ready_at"] = time.monotonic() + duration
+        state["model_time"] += duration
+        return SimpleNamespace(id=run_id, status="queued")
+
+    def model_time(self, run_id):
+        return self.runs[run_id]["model_time"]
+
+    def run_state(self, run_id):
+        state = self.runs[run_id]
+        status = "completed" if time.monotonic() >= state["ready_at"] - 1e-3 else "in_progress"
+        return SimpleNamespace(id=run_id, status=status, last_error=None, required_action=None)
@@ -0,0 +1,302 @@
+"""
+Local stand-ins for every upstream the bot talks to, with injected latency.
+
+Serves, on one port:
+    /v1/...         Assistants API (threads, messages, runs, tool rounds, SSE streaming)
+    /cmc/...        CoinMarketCap quotes/latest, info and market-pairs/latest
+    /coingecko/...  CoinGecko search/trending
+    /wolfram        Wolfram Alpha LLM API
+    /wiki           MediaWiki search
+    /arxiv          arXiv Atom feed
+
+Run standalone with:
+    python -m benchmarks.fake_upstreams --port 8900 --latency openai=0.05,cmc=0.2
+
+`bench_load` starts it in a subprocess so the fake servers don't share the
+benchmarked process's event loop or GIL.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import time
+from urllib.parse import parse_qs, urlsplit
+
+from utils.tool_executor import parse_limits
+
+REASONS = {200: "OK", 404: "Not Found", 502: "Bad Gateway"}
+DEFAULT_LATENCY = {"openai": 0.05, "cmc": 0.15, "coingecko": 0.12, "wolfram": 0.4, "wiki": 0.1, "arxiv": 0.3}
+
+# Tool calls a fake run can ask for, all of which hit other fake upstreams
+TOOL_CALLS = [
+    ("get_crypto_info_from_coinmarketcap", {"token_symbol": "BTC,ETH"}),
+    ("get_trending_cryptos", {}),
+    ("query_wolfram_alpha", {"queries": ["integrate x^2 dx"]}),
+    ("mediawiki_query", {"action": "query", "search_string": "Solana"}),
+    ("query_arxiv", {"search_query": "all:transformer", "max_results": 5}),
+]
+
+
+def upstream_env(base_url):
+    """Environment variables that point the bot and its tools at these stand-ins."""
+    return {
+        "OPENAI_BASE_URL": f"{base_url}/v1",
+        "CMC_BASE_URL": f"{base_url}/cmc/v1/cryptocurrency",
+        "COINGECKO_TRENDING_URL": f"{base_url}/coingecko/api/v3/search/trending",
+        "WOLFRAM_API_URL": f"{base_url}/wolfram",
+        "WIKIPEDIA_API_URL": f"{base_url}/wiki",
+        "ARXIV_API_URL": f"{base_url}/arxiv",
+    }
+
+
+class FakeUpstreams:
+    def __init__(self, latency=None, model_median=2.0, model_sigma=0.5, tool_probability=0.4,
+                 max_tool_rounds=2, reply_chars=600, seed=0):
+        self.latency = {**DEFAULT_LATENCY, **(latency or {})}
+        self.model_median = model_median
+        self.model_sigma = model_sigma
+        self.tool_probability = tool_probability
+        self.max_tool_rounds = max_tool_rounds
+        self.reply_chars = reply_chars
+        self.random = random.Random(seed)
+        self.ids = itertools.count(1)
+        self.runs = {}
+        self.replies = {}  # thread_id -> last assistant reply text
+        self.requests = {}
+
+    # -- HTTP plumbing -----------------------------------------------------
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, _ = request_line.decode().split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, value = line.decode().split(":", 1)
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length") or 0))
+                url = urlsplit(target)
+                query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+                payload = json.loads(body) if body else {}
+                await self.dispatch(method, url.path, query, payload, writer)
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def respond(self, writer, payload, status=200, content_type="application/json"):
+        body = payload if isinstance(payload, bytes) else json.dumps(payload).encode()
+        head = (f"HTTP/1.1 {status} {REASONS.get(status, 'OK')}\r\nContent-Type: {content_type}\r\n"
+                f"Content-Length: {len(body)}\r\n\r\n")
+        writer.write(head.encode() + body)
+        await writer.drain()
+
+    async def start_stream(self, writer):
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nTransfer-Encoding: chunked\r\n\r\n")
+        await writer.drain()
+
+    async def send_event(self, writer, event, data):
+        data = data if isinstance(data, str) else json.dumps(data)
+        chunk = f"event: {event}\ndata: {data}\n\n".encode()
+        writer.write(f"{len(chunk):x}\r\n".encode() + chunk + b"\r\n")
+        await writer.drain()
+
+    async def end_stream(self, writer):
+        await self.send_event(writer, "done", "[DONE]")
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+    async def dispatch(self, method, path, query, payload, writer):
+        parts = path.strip("/").split("/")
+        service = "openai" if parts[0] == "v1" else parts[0]
+        self.requests[service] = self.requests.get(service, 0) + 1
+        await asyncio.sleep(self.latency.get(service, 0))
+        handler = getattr(self, f"handle_{service}", None)
+        if handler is None:
+            await self.respond(writer, {"error": "not found"}, status=404)
+            return
+        await handler(method, parts, query, payload, writer)
+
+    # -- Assistants API ----------------------------------------------------
+
+    def model_time(self):
+        return self.random.lognormvariate(0, self.model_sigma) * self.model_median
+
+    def run_object(self, run_id):
+        run = self.runs[run_id]
+        now = time.monotonic()
+        if run["status"] in ("queued", "in_progress") and now >= run["ready_at"]:
+            if run["rounds_left"] > 0:
+                name, arguments = self.random.choice(TOOL_CALLS)
+                run["status"] = "requires_action"
+                run["tool_calls"] = [{"id": f"call_{next(self.ids)}", "type": "function",
+                                      "function": {"name": name, "arguments": json.dumps(arguments)}}]
+            else:
+                run["status"] = "completed"
+        elif run["status"] == "queued":
+            run["status"] = "in_progress"
+        required_action = None
+        if run["status"] == "requires_action":
+            required_action = {"type": "submit_tool_outputs", "submit_tool_outputs": {"tool_calls": run["tool_calls"]}}
+        return {"id": run_id, "object": "thread.run", "thread_id": run["thread_id"], "assistant_id": "asst_bench",
+                "status": run["status"], "required_action": required_action, "last_error": None,
+                "created_at": int(run["created_at"]), "usage": None}
+
+    def reply_text(self):
+        words = ["lorem", "ipsum", "dolor", "sit", "amet", "consectetur", "adipiscing", "elit"]
+        text = ""
+        while len(text) < self.reply_chars:
+            text += self.random.choice(words) + " "
+        return text.strip()
+
+    async def stream_run(self, run_id, writer):
+        run = self.runs[run_id]
+        await self.start_stream(writer)
+        await self.send_event(writer, "thread.run.created", self.run_object(run_id))
+        remaining = max(0.0, run["ready_at"] - time.monotonic())
+        if run["rounds_left"] > 0:
+            await asyncio.sleep(remaining)
+            await self.send_event(writer, "thread.run.requires_action", self.run_object(run_id))
+        else:
+            # Tokens start a third of the way into the model time and arrive until it ends
+            await asyncio.sleep(remaining / 3)
+            text = self.reply_text()
+            pieces = [text[i:i + 40] for i in range(0, len(text), 40)]
+            for piece in pieces:
+                delta = {"id": f"msg_{run_id}", "object": "thread.message.delta",
+                         "delta": {"content": [{"index": 0, "type": "text", "text": {"value": piece}}]}}
+                await self.send_event(writer, "thread.message.delta", delta)
+                await asyncio.sleep(remaining * 2 / 3 / len(pieces))
+            self.replies[run["thread_id"]] = text
+            await self.send_event(writer, "thread.run.completed", self.run_object(run_id))
+        await self.end_stream(writer)
+
+    async def handle_openai(self, method, parts, query, payload, writer):
+        now = time.time()
+        # /v1/threads
+        if parts[1:] == ["threads"]:
+            await self.respond(writer, {"id": f"thread_{next(self.ids)}", "object": "thread",
+                                        "created_at": int(now), "metadata": {}})
+            return
+        thread_id = parts[2]
+        if parts[3] == "messages":
+            if method == "POST":
+                await self.respond(writer, {"id": f"msg_{next(self.ids)}", "object": "thread.message",
+                                            "thread_id": thread_id, "role": "user", "created_at": int(now),
+                                            "content": [{"type": "text", "text": {"value": payload.get("content", ""), "annotations": []}}]})
+            else:
+                text = self.replies.get(thread_id, self.reply_text())
+                message = {"id": f"msg_{next(self.ids)}", "object": "thread.message", "thread_id": thread_id,
+                           "role": "assistant", "created_at": int(now),
+                           "content": [{"type": "text", "text": {"value": text, "annotations": []}}]}
+                await self.respond(writer, {"object": "list", "data": [message], "first_id": message["id"],
+                                            "last_id": message["id"], "has_more": False})
+            return
+        # /v1/threads/{thread_id}/runs[/{run_id}[/submit_tool_outputs|/cancel]]
+        if len(parts) == 4:
+            run_id = f"run_{next(self.ids)}"
+            rounds = 0
+            while rounds < self.max_tool_rounds and self.random.random() < self.tool_probability:
+                rounds += 1
+            self.runs[run_id] = {"thread_id": thread_id, "status": "queued", "created_at": now,
+                                 "ready_at": time.monotonic() + self.model_time(), "rounds_left": rounds}
+            if payload.get("stream"):
+                await self.stream_run(run_id, writer)
+                return
+            await self.respond(writer, self.run_object(run_id))
+            return
+        run_id = parts[4]
+        run = self.runs[run_id]
+        action = parts[5] if len(parts) > 5 else None
+        if action == "submit_tool_outputs":
+            run["rounds_left"] -= 1
+            run["status"] = "in_progress"
+            run["ready_at"] = time.monotonic() + self.model_time()
+            if payload.get("stream"):
+                await self.stream_run(run_id, writer)
+                return
+        elif action == "cancel":
+            run["status"] = "cancelled"
+        elif run["status"] == "completed" and run["thread_id"] not in self.replies:
+            self.replies[run["thread_id"]] = self.reply_text()
+        await self.respond(writer, self.run_object(run_id))
+
+    # -- Tool upstreams ----------------------------------------------------
+
+    async def handle_cmc(self, method, parts, query, payload, writer):
+        endpoint = "/".join(parts[3:])
+        symbols = [symbol.upper() for symbol in query.get("symbol", "BTC").split(",")]
+        if endpoint == "quotes/latest":
+            data = {symbol: {"symbol": symbol, "circulating_supply": 19_000_000, "total_supply": 21_000_000,
+                             "quote": {"USD": {"price": 60000.0, "market_cap": 1.1e12, "volume_24h": 3.2e10}}}
+                    for symbol in symbols}
+        elif endpoint == "info":
+            data = {symbol: {"description": f"{symbol} is a cryptocurrency.", "logo": "logo.png",
+                             "urls": {"website": ["https://example.org"]}} for symbol in symbols}
+        else:
+            data = {"market_pairs": [{"exchange": {"name": f"Exchange {i}"}} for i in range(20)]}
+        await self.respond(writer, {"data": data})
+
+    async def handle_coingecko(self, method, parts, query, payload, writer):
+        coins = [{"item": {"name": f"Coin {i}", "symbol": f"C{i}", "market_cap_rank": i + 1}} for i in range(15)]
+        await self.respond(writer, {"coins": coins})
+
+    async def handle_wolfram(self, method, parts, query, payload, writer):
+        text = f'{{"input": "{query.get("input", "")}", "result": "x^3/3 + constant", "url": "https://www.wolframalpha.com/x"}}'
+        await self.respond(writer, text.encode(), content_type="text/plain")
+
+    async def handle_wiki(self, method, parts, query, payload, writer):
+        results = [{"ns": 0, "title": f"{query.get('srsearch', '')} {i}", "pageid": i, "size": 1000 + i,
+                    "wordcount": 200, "snippet": "Lorem <span>ipsum</span> dolor sit amet", "timestamp": "2024-01-01T00:00:00Z"}
+                   for i in range(10)]
+        await self.respond(writer, {"batchcomplete": "", "query": {"searchinfo": {"totalhits": 10}, "search": results}})
+
+    async def handle_arxiv(self, method, parts, query, payload, writer):
+        count = int(query.get("max_results", 10))
+        entries = "".join(
+            f"<entry><id>http://arxiv.org/abs/2401.{i:05d}v1</id><updated>2024-01-02T00:00:00Z</updated>"
+            f"<published>2024-01-01T00:00:00Z</published><title>Paper {i}</title>"
+            f"<summary>{'An abstract sentence. ' * 20}</summary>"
+            f"<author><name>Author {i}</name></author><author><name>Author {i + 1}</name></author>"
+            f"<link href=\"http://arxiv.org/abs/2401.{i:05d}v1\" rel=\"alternate\" type=\"text/html\"/></entry>"
+            for i in range(count))
+        feed = (f'<?xml version="1.0" encoding="UTF-8"?><feed xmlns="http://www.w3.org/2005/Atom" '
+                f'xmlns:opensearch="http://a9.com/-/spec/opensearch/1.1/"><title>arXiv Query</title>'
+                f'<opensearch:totalResults>{count * 10}</opensearch:totalResults>{entries}</feed>')
+        await self.respond(writer, feed.encode(), content_type="application/atom+xml")
+
+
+async def serve(upstreams, host="127.0.0.1", port=0):
+    server = await asyncio.start_server(upstreams.handle, host, port)
+    return server, server.sockets[0].getsockname()[1]
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=0)
+    parser.add_argument("--latency", default="", help="per-service latency, e.g. openai=0.05,cmc=0.2")
+    parser.add_argument("--model-median", type=float, default=2.0, help="median model time per run segment (s)")
+    parser.add_argument("--tool-probability", type=float, default=0.4)
+    parser.add_argument("--reply-chars", type=int, default=600)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    upstreams = FakeUpstreams(latency=parse_limits(args.latency, cast=float), model_median=args.model_median,
+                              tool_probability=args.tool_probability, reply_chars=args.reply_chars, seed=args.seed)
+    server, port = await serve(upstreams, port=args.port)
+    print(f"READY {port}", flush=True)
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
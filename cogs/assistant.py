@@ -1,36 +1,46 @@
 #Imports are important
 
 import asyncio
-import json
 import logging
 import os
+import time
+from contextvars import ContextVar
 
-import aiosqlite
 import openai
 from nextcord.ext import commands
 
-from database.user_database import upsert_user_thread
-from functions.function_calls import (
-    generate_image_with_dalle,
-    get_crypto_info_from_coinmarketcap,
-    get_stock_info,
-    get_trending_cryptos,
-    mediawiki_query,
-    query_arxiv,
-    query_wolfram_alpha,
+from database.user_database import (
+    THREAD_LEASES,
+    UserThreadCache,
+    get_thread_stats,
+    record_thread_activity,
+    thread_lease,
 )
+from utils.discord_sender import OutboundSender
+from utils.image_jobs import ImageJobs
+from utils.logging_setup import sample_message_content
+from utils.metrics import FIRST_TOKEN_SECONDS, REPLY_SECONDS, STAGE_SECONDS, register_gauge
+from utils.openai_client import get_openai_client
+from utils.run_engine import RunDriver
+from utils.scheduler import ConversationScheduler
+from utils.streaming_reply import StreamingReply
+from utils.thread_lifecycle import ThreadPolicy, summarize_thread
+from utils.tool_executor import ToolExecutor, parse_limits
+from utils.tool_output import OutputCompactor
+from utils.tool_registry import ToolRegistry, ToolSpec
 
-# Initialize logging
-logging.basicConfig(level=logging.INFO, filename='discord.log', filemode='a', 
-                    format='%(asctime)s - %(levelname)s - %(message)s')
+# Handlers are configured once by main.setup_logging
 logger = logging.getLogger('discord')
 
 logger.info("Starting HeliusChatBot session.")
 
 # Configure OpenAI client
-client = openai.OpenAI()
 openai.api_key = os.getenv('OPENAI_API_KEY')
 ASSISTANT_ID = os.getenv('ASSISTANT_ID')
+API_CONCURRENCY = int(os.getenv('API_CONCURRENCY', '50'))  # Conversations processed at once
+MAX_TOOL_ROUNDS = int(os.getenv('MAX_TOOL_ROUNDS', '8'))  # requires_action rounds allowed per run
+STREAM_REPLIES = os.getenv('STREAM_REPLIES', '1') == '1'  # Show replies while they're generated
+TOOL_PREWARM = os.getenv('TOOL_PREWARM', '1') == '1'  # Import tool modules in the background once connected
 
 # Check for essential configurations
 if not openai.api_key:
@@ -41,176 +51,233 @@ if not ASSISTANT_ID:
     logger.critical("No ASSISTANT_ID found. Please set the ASSISTANT_ID environment variable.")
     raise ValueError("No ASSISTANT_ID found. Please set the ASSISTANT_ID environment variable.")
 
+client = get_openai_client()  # Shared async client, pooled connections
 logger.info("OpenAI client configured successfully with ASSISTANT_ID.")
 
-# Dynamic function call mapping
-function_mapping = {
-    'get_stock_info': get_stock_info,
-    'query_wolfram_alpha': query_wolfram_alpha,
-    'get_crypto_info_from_coinmarketcap': get_crypto_info_from_coinmarketcap,
-    'mediawiki_query': mediawiki_query,
-    'generate_image_with_dalle': generate_image_with_dalle,
-    'query_arxiv': query_arxiv,
-    'get_trending_cryptos': get_trending_cryptos,
-    # Add other function mappings here
+# Tools the assistant can call; each module (and its dependencies) is imported on first use
+tool_registry = ToolRegistry({
+    'get_stock_info': ToolSpec('functions.stock_tools', pruner='compact_stock_info'),
+    'query_wolfram_alpha': ToolSpec('functions.function_calls'),
+    'get_crypto_info_from_coinmarketcap': ToolSpec('functions.function_calls', pruner='compact_crypto_info'),
+    'mediawiki_query': ToolSpec('functions.function_calls', pruner='compact_mediawiki'),
+    'generate_image_with_dalle': ToolSpec('functions.function_calls'),
+    'query_arxiv': ToolSpec('functions.function_calls'),
+    'get_trending_cryptos': ToolSpec('functions.function_calls'),
+    # Add other tools here
+})
+function_mapping = tool_registry.mapping()
+
+# Per-tool caps on concurrent calls and per-tool timeouts (seconds); override with
+# e.g. TOOL_CONCURRENCY_LIMITS="get_stock_info=4,query_arxiv=8"
+TOOL_CONCURRENCY_LIMITS = {
+    'get_stock_info': 4,
+    **parse_limits(os.getenv('TOOL_CONCURRENCY_LIMITS')),
+}
+TOOL_TIMEOUTS = {
+    **parse_limits(os.getenv('TOOL_TIMEOUTS'), cast=float),
+}
+# Bytes of JSON each tool may submit to a run, e.g. TOOL_OUTPUT_BUDGETS="query_arxiv=12000"
+TOOL_OUTPUT_BUDGETS = {
+    'query_arxiv': 12000,
+    **parse_limits(os.getenv('TOOL_OUTPUT_BUDGETS')),
 }
 
 logger.info("Function mappings have been initialized.")
 
-async def wait_on_run(client, thread_id, run_id, check_interval=4.0):
-    logger.info(f"Waiting on run {run_id} in thread {thread_id}")
-    while True:
-        await asyncio.sleep(check_interval)
-        loop = asyncio.get_running_loop()
-        
-        def retrieve_run_sync():
-            return client.beta.threads.runs.retrieve(thread_id=thread_id, run_id=run_id)
-        
-        run = await loop.run_in_executor(None, retrieve_run_sync)
-        if run.status in ["requires_action", "completed"]:
-            logger.info(f"Run {run_id} status: {run.status}")
-            return run
+# Channel of the reply being worked on; set per conversation worker, read by tools that post on their own
+reply_channel = ContextVar('reply_channel')
 
 class HeliusChatBot(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.api_semaphore = asyncio.Semaphore(50)  # Control API call rate
-        self.user_threads = {}  # User-specific threads
-        self.last_bot_message_id = {}  # Track last message IDs per user
+        self.api_semaphore = asyncio.Semaphore(API_CONCURRENCY)  # Control API call rate
+        self.user_threads = UserThreadCache()  # User-specific threads, loaded on demand
+        self.sender = OutboundSender()  # Rate-limited sends; remembers each user's last reply
         self.helius_assistant_id = ASSISTANT_ID
-        self.allowed_channel_ids = [1209270991948349461, 1101204273339056139, 1137349870194270270]  # REPLACE WITH YOUR OWN SERVER CHANNELS
-        self.message_queues = {}  # Queue for managing messages per thread
+        self.allowed_channel_ids = {1209270991948349461, 1101204273339056139, 1137349870194270270}  # REPLACE WITH YOUR OWN SERVER CHANNELS
+        bot.served_channel_ids = self.allowed_channel_ids  # Lets the bot drop other channels' events before parsing
+        self.scheduler = ConversationScheduler(self.process_queued_messages, self.api_semaphore)  # One worker per user
+        self.thread_policy = ThreadPolicy()  # When a user's thread is replaced by a fresh, summarised one
+        self.run_driver = RunDriver(client)  # Adaptive polling of run status
+        self.image_jobs = ImageJobs(function_mapping['generate_image_with_dalle'], self.sender)  # Images finish in the background
+        tools = {**function_mapping, 'generate_image_with_dalle': self.start_image_job}
+        self.tool_executor = ToolExecutor(tools, timeouts=TOOL_TIMEOUTS,
+                                          concurrency=TOOL_CONCURRENCY_LIMITS,
+                                          compactor=OutputCompactor(budgets=TOOL_OUTPUT_BUDGETS, pruners=tool_registry.pruners()))
+        self.prewarm_task = None
+        self.register_metrics()
         logger.info("HeliusChatBot cog initialized.")
 
+    def register_metrics(self):
+        register_gauge('helius_conversations_active', 'Conversations with a live queue worker.',
+                       lambda: [({}, self.scheduler.stats()["active_conversations"])])
+        register_gauge('helius_messages_queued', 'Messages waiting in conversation queues.',
+                       lambda: [({}, self.scheduler.queue_depth())])
+        register_gauge('helius_user_thread_cache_entries', 'Users held in the user->thread cache.',
+                       lambda: [({}, self.user_threads.stats()["size"])])
+        register_gauge('helius_user_thread_cache_hit_ratio', 'Hit rate of the user->thread cache.',
+                       lambda: [({}, self.user_threads.stats()["hit_rate"])])
+        register_gauge('helius_discord_sends_throttled_total', 'Sends delayed by a channel rate-limit bucket.',
+                       lambda: [({}, self.sender.throttled)], metric_type="counter")
+        register_gauge('helius_image_jobs', 'Background image generation jobs by state.',
+                       lambda: [({"state": state}, count) for state, count in self.image_jobs.stats().items()])
+
     @commands.Cog.listener()
     async def on_ready(self):
         logger.info(f"{self.bot.user} is connected to Discord.")
-        async with aiosqlite.connect('database/user_threads.db') as db:
-            async with db.execute("SELECT user_id, thread_id FROM user_threads") as cursor:
-                async for row in cursor:
-                    self.user_threads[int(row[0])] = row[1]
-        logger.info("User threads loaded from the database.")
+        stats = self.user_threads.stats()
+        logger.info(f"User thread cache: {stats['size']} cached, hit rate {stats['hit_rate']:.1%}.")
+        if TOOL_PREWARM and self.prewarm_task is None:
+            # on_ready fires again after reconnects; prewarm only once
+            self.prewarm_task = asyncio.create_task(tool_registry.prewarm())
 
     @commands.Cog.listener()
     async def on_message(self, message):
         if message.author.bot or message.channel.id not in self.allowed_channel_ids:
             return
 
-        logger.info(f"Message from {message.author}: {message.content}")
+        # Content is private and large; log it only for a sample of messages
+        log_fields = {"user_id": message.author.id, "channel_id": message.channel.id, "length": len(message.content)}
+        if sample_message_content():
+            log_fields["content"] = message.content
+        logger.info("Message received.", extra=log_fields)
 
         is_mention = self.bot.user in message.mentions
-        is_reply = message.reference and message.reference.message_id == self.last_bot_message_id.get(message.author.id)
+        is_reply = message.reference and self.sender.is_reply_to_bot(message.author.id, message.reference.message_id)
 
         if is_mention or is_reply:
-            user_id = message.author.id
-            thread_id = self.user_threads.get(user_id)
+            # A user's messages are processed in order by a single worker, which also
+            # picks (and rolls over) their thread, so no two runs ever share a thread
+            self.scheduler.submit(message.author.id, message)
+
+    async def process_queued_messages(self, user_id, messages):
+        # Several messages when COALESCE_WINDOW merged a burst into one run
+        message = messages[-1]
+        try:
+            # Another bot process may be serving this user (sharded mode); wait our turn
+            async with thread_lease(f"user:{user_id}"), message.channel.typing():
+                with REPLY_SECONDS.time():
+                    thread_id = await self.thread_for_user(user_id)
+                    await self.process_user_message(user_id, thread_id, messages)
+        except Exception as e:
+            logger.error(f"Error processing message: {e}")
+            await self.sender.send(message.channel, "Sorry, I encountered an error handling your request.")
 
+    async def thread_for_user(self, user_id):
+        """The user's current thread: created on first contact, rolled over when the policy says so."""
+        with STAGE_SECONDS.time(stage="thread_lookup"):
+            # In sharded mode another process may have rolled the thread over since we cached it
+            thread_id = await self.user_threads.get(user_id, refresh=THREAD_LEASES)
             if thread_id is None:
-                thread_id = await self.create_thread_for_user(user_id)
-
-            # Queue management
-            if thread_id not in self.message_queues:
-                self.message_queues[thread_id] = asyncio.Queue()
-            await self.message_queues[thread_id].put((user_id, message))
-            if self.message_queues[thread_id].qsize() == 1:  # If this is the only message, start processing
-                asyncio.create_task(self.process_message_queue(thread_id))
-
-    async def process_message_queue(self, thread_id):
-        while not self.message_queues[thread_id].empty():
-            user_id, message = await self.message_queues[thread_id].get()
-            async with self.api_semaphore:
-                try:
-                    async with message.channel.typing():
-                        await self.process_user_message(user_id, thread_id, message)
-                except Exception as e:
-                    logger.error(f"Error processing message: {e}")
-                    await message.channel.send("Sorry, I encountered an error handling your request.")
-                finally:
-                    self.message_queues[thread_id].task_done()
+                return await self.create_thread_for_user(user_id)
+            reason = self.thread_policy.rollover_reason(await get_thread_stats(thread_id))
+        if reason is not None:
+            with STAGE_SECONDS.time(stage="thread_rollover"):
+                thread_id = await self.roll_over_thread(user_id, thread_id, reason)
+        return thread_id
+
+    async def roll_over_thread(self, user_id, old_thread_id, reason):
+        """Move the user to a new thread that starts from a summary of the old one."""
+        try:
+            summary = await summarize_thread(client, old_thread_id)
+        except Exception as e:
+            # Better a fresh thread without context than a thread that keeps growing
+            logger.warning(f"Failed to summarise thread {old_thread_id}: {e}")
+            summary = None
+        messages = []
+        if summary:
+            messages.append({"role": "user", "content": f"(Notes carried over from our earlier conversation)\n{summary}"})
+        thread = await client.beta.threads.create(messages=messages)
+        await self.user_threads.set(user_id, thread.id)
+        await record_thread_activity(thread.id, user_id, len(messages))
+        logger.info(f"Thread {old_thread_id} of user {user_id} rolled over to {thread.id} ({reason}).")
+        return thread.id
 
     async def create_thread_for_user(self, user_id):
-        loop = asyncio.get_running_loop()
-        
-        def create_thread_sync():
-            return client.beta.threads.create().id
-        
-        thread_id = await loop.run_in_executor(None, create_thread_sync)
-        self.user_threads[user_id] = thread_id
-        logger.info(f"New thread created for user {user_id}: {thread_id}")
-        await upsert_user_thread(user_id, thread_id)
+        thread = await client.beta.threads.create()
+        # If a concurrent message (here or in another process) already stored a thread, use that one
+        thread_id = await self.user_threads.claim(user_id, thread.id)
+        if thread_id == thread.id:
+            await record_thread_activity(thread_id, user_id, 0)
+            logger.info(f"New thread created for user {user_id}: {thread_id}")
         return thread_id
 
-    async def process_user_message(self, user_id, thread_id, message):
-        loop = asyncio.get_running_loop()
-    
-        # Synchronous wrapper for adding a message
-        def add_message_sync():
-            client.beta.threads.messages.create(thread_id=thread_id, role="user", content=message.content)
-        
-        # Synchronous wrapper for creating a run
-        def create_run_sync():
-            return client.beta.threads.runs.create(thread_id=thread_id, assistant_id=self.helius_assistant_id).id
-    
-        await loop.run_in_executor(None, add_message_sync)
-        logger.info(f"Message from user {user_id} added to thread {thread_id}.")
-    
-        run_id = await loop.run_in_executor(None, create_run_sync)
-        run = await wait_on_run(client, thread_id, run_id)
-    
-        # Check if the run requires action and process accordingly
-        if run.status == "requires_action":
-            tool_outputs = []
-            for tool_call in run.required_action.submit_tool_outputs.tool_calls:
-                function_name = tool_call.function.name
-                arguments = json.loads(tool_call.function.arguments)
-                logger.info(f"Function {function_name} with arguments {arguments} needs to be called.")
-    
-                # Execute the function if it's in our mapping
-                if function_name in function_mapping:
-                    function_to_call = function_mapping[function_name]
-                    try:
-                        output = await function_to_call(**arguments)
-                        tool_outputs.append({
-                            "tool_call_id": tool_call.id,
-                            "output": json.dumps(output)
-                        })
-                        logger.info(f"Function {function_name} called successfully.")
-                    except Exception as e:
-                        logger.error(f"Error calling function {function_name}: {e}")
-                        tool_outputs.append({
-                            "tool_call_id": tool_call.id,
-                            "output": json.dumps({"error": str(e)})
-                        })
-    
-            # Submit the results of the function calls and update the run status
-            await loop.run_in_executor(None, lambda: client.beta.threads.runs.submit_tool_outputs(
-                thread_id=thread_id,
-                run_id=run.id,
-                tool_outputs=tool_outputs
-            ))
-            logger.info(f"Tool outputs submitted for run {run.id}.")
-    
-            # Re-check the run status after submitting tool outputs
-            run = await wait_on_run(client, thread_id, run.id)
-            if run.status == "completed":
+    async def process_user_message(self, user_id, thread_id, messages):
+        """Add the user's message(s) to the thread, run the assistant once and reply."""
+        reply_channel.set(messages[-1].channel)
+        with STAGE_SECONDS.time(stage="message_add"):
+            for queued_message in messages:
+                await client.beta.threads.messages.create(thread_id=thread_id, role="user", content=queued_message.content)
+        logger.info(f"{len(messages)} message(s) from user {user_id} added to thread {thread_id}.")
+        message = messages[-1]
+
+        # In streaming mode the reply is posted and edited as tokens arrive; time to first
+        # token counts from when the user sent the message, so queueing and thread setup are included
+        reply = StreamingReply(message.channel, self.sender, started_at=arrival_time(message)) if STREAM_REPLIES else None
+        on_text = reply.feed if reply is not None else None
+        run = await self.run_driver.create(thread_id, self.helius_assistant_id, on_text=on_text)
+        run, rounds = await self.complete_run(thread_id, run, on_text=on_text)
+
+        # Feed the thread rollover policy: the user's messages plus the reply, and the run's token usage.
+        # usage.prompt_tokens adds up the prompts of every model step (one per tool round plus the
+        # reply), so divide by the steps to get the size of the context a single step reads
+        usage = getattr(run, "usage", None)
+        prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+        await record_thread_activity(thread_id, user_id, len(messages) + 1,
+                                     total_tokens=getattr(usage, "total_tokens", 0) or 0,
+                                     context_tokens=prompt_tokens // (rounds + 1))
+
+        if reply is not None and reply.messages:
+            with STAGE_SECONDS.time(stage="discord_send"):
+                await reply.finish()
+            self.sender.record_reply(user_id, reply.messages)
+            FIRST_TOKEN_SECONDS.observe(reply.time_to_first_token)
+            logger.info(f"Reply streamed to user {user_id}, first token visible after {reply.time_to_first_token:.2f}s.")
+
+        if run.status == "completed":
+            if reply is None or not reply.messages:
                 # Retrieve and send the latest message from the assistant to the user
-                final_message = await self.get_final_message_from_thread(thread_id)
-                await self.send_final_message(user_id, message.channel, final_message)
-            else:
-                logger.error(f"Run {run.id} did not complete as expected. Status: {run.status}")
-                await message.channel.send("Sorry, I encountered an issue processing your request. Please try again.")
+                with STAGE_SECONDS.time(stage="final_fetch"):
+                    final_message = await self.get_final_message_from_thread(thread_id)
+                with STAGE_SECONDS.time(stage="discord_send"):
+                    await self.send_final_message(user_id, message.channel, final_message)
         else:
-            # In case the status is not 'requires_action' but is 'completed', directly fetch the final message
-            final_message = await self.get_final_message_from_thread(thread_id)
-            await self.send_final_message(user_id, message.channel, final_message)
+            # failed, expired, cancelled or cut off after too many tool rounds
+            last_error = getattr(run, "last_error", None)
+            logger.error(f"Run {run.id} did not complete as expected. Status: {run.status}. Last error: {last_error}")
+            await self.sender.send(message.channel, "Sorry, I encountered an issue processing your request. Please try again.")
+
+    async def complete_run(self, thread_id, run, on_text=None):
+        """Drive a run through any number of tool-output rounds, up to MAX_TOOL_ROUNDS; returns (run, rounds)."""
+        rounds = 0
+        while run.status == "requires_action":
+            if rounds >= MAX_TOOL_ROUNDS:
+                logger.warning(f"Run {run.id} exceeded {MAX_TOOL_ROUNDS} tool rounds, cancelling it.")
+                await client.beta.threads.runs.cancel(thread_id=thread_id, run_id=run.id)
+                break
+            rounds += 1
+
+            # Run every requested tool at once; latency is the slowest call, not the sum
+            tool_calls = run.required_action.submit_tool_outputs.tool_calls
+            tool_outputs = await self.tool_executor.run(tool_calls)
+
+            # Submit the results of the function calls and wait for the next status
+            logger.info(f"Submitting tool outputs for run {run.id} (round {rounds}).")
+            run = await self.run_driver.submit_tool_outputs(thread_id, run.id, tool_outputs, on_text=on_text)
+        return run, rounds
+
+    async def start_image_job(self, **arguments):
+        """Tool entry point for image generation: acknowledge now, post the image when it's done."""
+        job_id = await self.image_jobs.start(reply_channel.get(), **arguments)
+        return {
+            "status": "pending",
+            "job_id": job_id,
+            "note": "The image is being generated and will replace the acknowledgement posted in the channel.",
+        }
 
     async def get_final_message_from_thread(self, thread_id):
-        loop = asyncio.get_running_loop()
-    
-        def list_messages_sync():
-            return client.beta.threads.messages.list(thread_id=thread_id, order="desc", limit=1).data
-    
-        messages = await loop.run_in_executor(None, list_messages_sync)
+        page = await client.beta.threads.messages.list(thread_id=thread_id, order="desc", limit=1)
+        messages = page.data
         if messages:
             assistant_messages = [msg for msg in messages if msg.role == "assistant"]
             if assistant_messages:
@@ -218,14 +285,17 @@ class HeliusChatBot(commands.Cog):
         return "I've processed your request, but I don't have anything more to say."
 
     async def send_final_message(self, user_id, channel, final_message):
-        if len(final_message) > 2000:
-            for part in [final_message[i:i+2000] for i in range(0, len(final_message), 2000)]:
-                await channel.send(part)
-        else:
-            sent_message = await channel.send(final_message)
-            self.last_bot_message_id[user_id] = sent_message.id
+        # Split on markdown boundaries and record every chunk so replies to any of them count
+        await self.sender.send(channel, final_message, user_id=user_id)
         logger.info(f"Final response sent to user {user_id}.")
 
+
+def arrival_time(message):
+    """When `message` was sent, on the event loop clock (from its snowflake timestamp)."""
+    age = max(0.0, time.time() - message.created_at.timestamp())
+    return asyncio.get_running_loop().time() - age
+
+
 def setup(bot):
     try:
         bot.add_cog(HeliusChatBot(bot))
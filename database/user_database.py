@@ -1,34 +1,304 @@
+import asyncio
+import logging
+import os
+import socket
+import time
+from contextlib import asynccontextmanager
+
 import aiosqlite
 
-db_name = 'database/user_threads.db'
+from utils.cache import LRUCache
+
+logger = logging.getLogger('discord')
+
+db_name = os.getenv('USER_DB_PATH', 'database/user_threads.db')
+COMMIT_WINDOW = float(os.getenv('DB_COMMIT_WINDOW', '0.05'))  # Seconds of upserts grouped per commit
+USER_THREAD_CACHE_SIZE = int(os.getenv('USER_THREAD_CACHE_SIZE', '10000'))
+BUSY_TIMEOUT_MS = int(os.getenv('DB_BUSY_TIMEOUT_MS', '5000'))  # Wait for other processes' write locks
+
+# Cross-process per-thread ordering, switched on by the sharded launcher in main.py
+THREAD_LEASES = os.getenv('THREAD_LEASES', '0') == '1'
+THREAD_LEASE_TTL = float(os.getenv('THREAD_LEASE_TTL', '900'))  # Longer than any run with its tool rounds
+LEASE_OWNER = f"{socket.gethostname()}:{os.getpid()}"
+
+# Statements are module constants so sqlite's statement cache keeps them prepared
+CREATE_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS user_threads (
+    user_id TEXT PRIMARY KEY,
+    thread_id TEXT NOT NULL
+);
+"""
+UPSERT_THREAD_SQL = """
+INSERT INTO user_threads (user_id, thread_id)
+VALUES (?, ?)
+ON CONFLICT(user_id) DO UPDATE SET
+thread_id = excluded.thread_id;
+"""
+SELECT_THREAD_SQL = "SELECT thread_id FROM user_threads WHERE user_id = ?"
+# First writer wins: a thread created concurrently elsewhere is kept over ours
+CLAIM_THREAD_SQL = "INSERT INTO user_threads (user_id, thread_id) VALUES (?, ?) ON CONFLICT(user_id) DO NOTHING;"
+
+CREATE_LEASES_SQL = """
+CREATE TABLE IF NOT EXISTS thread_leases (
+    thread_id TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+"""
+# Takes the lease when it's free, expired or already ours
+ACQUIRE_LEASE_SQL = """
+INSERT INTO thread_leases (thread_id, owner, expires_at)
+VALUES (?, ?, ?)
+ON CONFLICT(thread_id) DO UPDATE SET
+owner = excluded.owner, expires_at = excluded.expires_at
+WHERE thread_leases.owner = excluded.owner OR thread_leases.expires_at < ?;
+"""
+RELEASE_LEASE_SQL = "DELETE FROM thread_leases WHERE thread_id = ? AND owner = ?"
+
+# Per-thread usage, read by the thread rollover policy
+CREATE_STATS_SQL = """
+CREATE TABLE IF NOT EXISTS thread_stats (
+    thread_id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    messages INTEGER NOT NULL DEFAULT 0,
+    total_tokens INTEGER NOT NULL DEFAULT 0,
+    context_tokens INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    last_active REAL NOT NULL
+);
+"""
+RECORD_ACTIVITY_SQL = """
+INSERT INTO thread_stats (thread_id, user_id, messages, total_tokens, context_tokens, created_at, last_active)
+VALUES (?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT(thread_id) DO UPDATE SET
+messages = messages + excluded.messages,
+total_tokens = total_tokens + excluded.total_tokens,
+context_tokens = excluded.context_tokens,
+last_active = excluded.last_active;
+"""
+SELECT_STATS_SQL = """
+SELECT messages, total_tokens, context_tokens, created_at, last_active
+FROM thread_stats WHERE thread_id = ?
+"""
+
+
+class Database:
+    """
+    One long-lived aiosqlite connection shared by every caller.
+
+    The connection runs in WAL mode with synchronous=NORMAL. Upserts are queued
+    and written by a single executemany + commit once `commit_window` has passed,
+    so a burst of new users costs one fsync instead of one connection, thread and
+    commit each. Callers still wait until their row is committed.
+
+    Several bot processes can share the file: writers wait up to BUSY_TIMEOUT_MS
+    for each other, new user threads are claimed first-writer-wins, and thread
+    leases keep one conversation from being worked on by two processes at once.
+    """
+
+    def __init__(self, path=db_name, commit_window=COMMIT_WINDOW):
+        self.path = path
+        self.commit_window = commit_window
+        self._conn = None
+        self._connect_lock = asyncio.Lock()
+        self._pending = {}  # user_id -> (thread_id, [futures])
+        self._flush_scheduled = False
+        self._flush_tasks = set()
+
+    async def connect(self):
+        async with self._connect_lock:
+            if self._conn is None:
+                self._conn = await aiosqlite.connect(self.path)
+                await self._conn.execute("PRAGMA journal_mode=WAL")
+                await self._conn.execute("PRAGMA synchronous=NORMAL")
+                await self._conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+                await self._conn.execute(CREATE_TABLE_SQL)
+                await self._conn.execute(CREATE_LEASES_SQL)
+                await self._conn.execute(CREATE_STATS_SQL)
+                await self._conn.commit()
+                logger.info(f"Database connection opened: {self.path}")
+        return self._conn
+
+    async def close(self):
+        if self._flush_tasks:
+            await asyncio.gather(*self._flush_tasks, return_exceptions=True)
+        if self._conn is not None:
+            await self._conn.close()
+            self._conn = None
+            logger.info("Database connection closed.")
+
+    async def upsert_user_thread(self, user_id, thread_id):
+        future = asyncio.get_running_loop().create_future()
+        _, futures = self._pending.get(str(user_id), (None, []))
+        futures.append(future)
+        self._pending[str(user_id)] = (thread_id, futures)
+        if not self._flush_scheduled:
+            self._flush_scheduled = True
+            task = asyncio.create_task(self._flush_after_window())
+            self._flush_tasks.add(task)
+            task.add_done_callback(self._flush_tasks.discard)
+        await future
+
+    async def _flush_after_window(self):
+        await asyncio.sleep(self.commit_window)
+        batch, self._pending = self._pending, {}
+        self._flush_scheduled = False
+        try:
+            conn = await self.connect()
+            await conn.executemany(UPSERT_THREAD_SQL, [(user_id, thread_id) for user_id, (thread_id, _) in batch.items()])
+            await conn.commit()
+        except Exception as e:
+            logger.error(f"Failed to commit {len(batch)} user thread(s): {e}")
+            for _, futures in batch.values():
+                for future in futures:
+                    if not future.done():  # The caller may have been cancelled meanwhile
+                        future.set_exception(e)
+        else:
+            for _, futures in batch.values():
+                for future in futures:
+                    if not future.done():
+                        future.set_result(None)
+
+    async def get_thread_id(self, user_id):
+        # Serve writes still waiting for their group commit
+        pending = self._pending.get(str(user_id))
+        if pending is not None:
+            return pending[0]
+        conn = await self.connect()
+        async with conn.execute(SELECT_THREAD_SQL, (str(user_id),)) as cursor:
+            row = await cursor.fetchone()
+            return row[0] if row else None
+
+    async def claim_user_thread(self, user_id, thread_id):
+        """Store `thread_id` unless the user already has a thread; return the one that's kept."""
+        pending = self._pending.get(str(user_id))
+        if pending is not None:
+            return pending[0]
+        conn = await self.connect()
+        await conn.execute(CLAIM_THREAD_SQL, (str(user_id), thread_id))
+        await conn.commit()
+        return await self.get_thread_id(user_id)
+
+    async def record_thread_activity(self, thread_id, user_id, messages, total_tokens=0, context_tokens=0):
+        """
+        Add `messages` and `total_tokens` to the thread's totals. `context_tokens` replaces the
+        stored value: the latest run's prompt tokens divided by its model steps.
+        """
+        now = time.time()
+        conn = await self.connect()
+        await conn.execute(RECORD_ACTIVITY_SQL, (thread_id, str(user_id), messages, total_tokens, context_tokens, now, now))
+        await conn.commit()
+
+    async def get_thread_stats(self, thread_id):
+        conn = await self.connect()
+        async with conn.execute(SELECT_STATS_SQL, (thread_id,)) as cursor:
+            row = await cursor.fetchone()
+        if row is None:
+            return None
+        return dict(zip(("messages", "total_tokens", "context_tokens", "created_at", "last_active"), row))
+
+    async def acquire_thread_lease(self, thread_id, owner=LEASE_OWNER, ttl=THREAD_LEASE_TTL):
+        now = time.time()
+        conn = await self.connect()
+        cursor = await conn.execute(ACQUIRE_LEASE_SQL, (thread_id, owner, now + ttl, now))
+        acquired = cursor.rowcount > 0
+        await cursor.close()
+        await conn.commit()
+        return acquired
+
+    async def release_thread_lease(self, thread_id, owner=LEASE_OWNER):
+        conn = await self.connect()
+        await conn.execute(RELEASE_LEASE_SQL, (thread_id, owner))
+        await conn.commit()
+
+    @asynccontextmanager
+    async def thread_lease(self, thread_id, owner=LEASE_OWNER, ttl=THREAD_LEASE_TTL):
+        """Hold `thread_id` exclusively across processes while the block runs (no-op unless THREAD_LEASES)."""
+        if not THREAD_LEASES:
+            yield
+            return
+        delay = 0.05
+        while not await self.acquire_thread_lease(thread_id, owner, ttl):
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 1.0)
+        try:
+            yield
+        finally:
+            await self.release_thread_lease(thread_id, owner)
+
+
+db = Database()
+
+
+async def connect():
+    await db.connect()
+
+async def close():
+    await db.close()
 
 async def create_table():
-    async with aiosqlite.connect(db_name) as db:
-        await db.execute("""
-        CREATE TABLE IF NOT EXISTS user_threads (
-            user_id TEXT PRIMARY KEY,
-            thread_id TEXT NOT NULL
-        );
-        """)
-        await db.commit()
+    await db.connect()
 
 async def upsert_user_thread(user_id, thread_id):
-    async with aiosqlite.connect(db_name) as db:
-        await db.execute("""
-            INSERT INTO user_threads (user_id, thread_id)
-            VALUES (?, ?)
-            ON CONFLICT(user_id) DO UPDATE SET 
-            thread_id = excluded.thread_id;
-        """, (user_id, thread_id))
-        await db.commit()
+    await db.upsert_user_thread(user_id, thread_id)
 
 async def get_thread_id(user_id):
-    async with aiosqlite.connect(db_name) as db:
-        async with db.execute("SELECT thread_id FROM user_threads WHERE user_id = ?", (user_id,)) as cursor:
-            row = await cursor.fetchone()
-            return row[0] if row else None
+    return await db.get_thread_id(user_id)
+
+async def claim_user_thread(user_id, thread_id):
+    return await db.claim_user_thread(user_id, thread_id)
+
+def thread_lease(thread_id):
+    return db.thread_lease(thread_id)
+
+async def record_thread_activity(thread_id, user_id, messages, total_tokens=0, context_tokens=0):
+    await db.record_thread_activity(thread_id, user_id, messages, total_tokens, context_tokens)
+
+async def get_thread_stats(thread_id):
+    return await db.get_thread_stats(thread_id)
+
+
+class UserThreadCache:
+    """
+    Read-through, size-bounded map of user_id -> thread_id.
+
+    Users are looked up in the database the first time they're seen and then
+    served from memory, so start-up cost and memory don't grow with the number
+    of users who have ever talked to the bot.
+    """
+
+    def __init__(self, maxsize=USER_THREAD_CACHE_SIZE):
+        self.lru = LRUCache(maxsize)
+
+    async def get(self, user_id, refresh=False):
+        # `refresh` re-reads the database, e.g. when another process may have rolled the thread over
+        thread_id = None if refresh else self.lru.get(user_id)
+        if thread_id is None:
+            thread_id = await get_thread_id(user_id)
+            if thread_id is not None:
+                self.lru.set(user_id, thread_id)
+        return thread_id
+
+    async def set(self, user_id, thread_id):
+        self.lru.set(user_id, thread_id)
+        await upsert_user_thread(user_id, thread_id)
+
+    async def claim(self, user_id, thread_id):
+        """Record a newly created thread; returns the thread to use if another was stored first."""
+        thread_id = await claim_user_thread(user_id, thread_id)
+        self.lru.set(user_id, thread_id)
+        return thread_id
+
+    def stats(self):
+        return {
+            "size": len(self.lru),
+            "maxsize": self.lru.maxsize,
+            "hits": self.lru.hits,
+            "misses": self.lru.misses,
+            "hit_rate": self.lru.hit_rate(),
+        }
 
-# Ensure to call these functions in an async context:
-# await create_table()
+# The connection is opened once at bot start-up (HeliusBot.start) and shared:
+# await connect()
 # await upsert_user_thread(your_user_id, your_thread_id)
-# your_thread_id = await get_thread_id(your_user_id)
\ No newline at end of file
+# your_thread_id = await get_thread_id(your_user_id)
@@ -1,145 +1,103 @@
+import asyncio
 import json
 import os
 import re
 from typing import Literal
-
-import httpx
-import openai
-import pandas as pd
-import xmltodict
-import yfinance as yf
-
-
-async def get_stock_info(tickers, info_types):
-    result = {}
-
-    for ticker in tickers:
-        stock_info = yf.Ticker(ticker)
-        ticker_result = {}
-
+from xml.etree import ElementTree
+
+from utils.cache import cached
+from utils.http_clients import get_http_client
+from utils.openai_client import get_openai_client
+
+# Upstream endpoints; overridable so benchmarks can point tools at local stand-ins
+WOLFRAM_API_URL = os.getenv('WOLFRAM_API_URL', "https://www.wolframalpha.com/api/v1/llm-api")
+CMC_BASE_URL = os.getenv('CMC_BASE_URL', "https://pro-api.coinmarketcap.com/v1/cryptocurrency")
+WIKIPEDIA_API_URL = os.getenv('WIKIPEDIA_API_URL', "https://en.wikipedia.org/w/api.php")
+ARXIV_API_URL = os.getenv('ARXIV_API_URL', "http://export.arxiv.org/api/query")
+COINGECKO_TRENDING_URL = os.getenv('COINGECKO_TRENDING_URL', "https://api.coingecko.com/api/v3/search/trending")
+
+# Cache lifetimes (seconds) per kind of data
+PRICE_TTL = 30
+TRENDING_TTL = 5 * 60
+SEARCH_TTL = 60 * 60
+REFERENCE_TTL = 24 * 60 * 60
+
+# Wolfram Alpha queries of one call run concurrently, with a process-wide cap
+WOLFRAM_CONCURRENCY = int(os.getenv('WOLFRAM_CONCURRENCY', '4'))
+WOLFRAM_TIMEOUT = float(os.getenv('WOLFRAM_TIMEOUT', '15'))  # Seconds per attempt
+WOLFRAM_RETRIES = int(os.getenv('WOLFRAM_RETRIES', '2'))  # Extra attempts after a 502
+WOLFRAM_RETRY_BACKOFF = 0.5
+URL_PATTERN = re.compile(r'http\S+')
+_wolfram_semaphore = asyncio.Semaphore(WOLFRAM_CONCURRENCY)
+
+# Image generation is slow and expensive; generated URLs stay valid for about an hour
+IMAGE_CONCURRENCY = int(os.getenv('IMAGE_CONCURRENCY', '2'))
+IMAGE_TTL = 50 * 60
+_image_semaphore = asyncio.Semaphore(IMAGE_CONCURRENCY)
+
+
+async def _wolfram_query(client, query, wolfram_id):
+    params = {
+        "input": query,
+        "appid": wolfram_id
+    }
+    for attempt in range(WOLFRAM_RETRIES + 1):
+        async with _wolfram_semaphore:
+            response = await asyncio.wait_for(client.get(WOLFRAM_API_URL, params=params), WOLFRAM_TIMEOUT)
+        if response.status_code != 502 or attempt == WOLFRAM_RETRIES:
+            break
+        # Wolfram's gateway drops requests under load; they usually go through on retry
+        await asyncio.sleep(WOLFRAM_RETRY_BACKOFF * 2 ** attempt)
+
+    if response.status_code == 200:
+        response_text_no_urls = URL_PATTERN.sub('', response.text)
         try:
-            if "current_price" in info_types:
-                stock_history = stock_info.history(period="1d")
-                ticker_result["current_price"] = stock_history["Close"].iloc[0]
-
-            if "dividends" in info_types:
-                dividends_df = stock_info.dividends.reset_index()
-                dividends_df['Date'] = dividends_df['Date'].astype(str)
-                ticker_result["dividends"] = dividends_df.to_dict(orient='list')
-
-            if "splits" in info_types:
-                splits_df = stock_info.splits.reset_index()
-                splits_df['Date'] = splits_df['Date'].astype(str)
-                ticker_result["splits"] = splits_df.to_dict(orient='list')
-
-            if "company_info" in info_types:
-                ticker_result["company_info"] = stock_info.info
-
-            if "financials" in info_types:
-                financials_df = stock_info.financials.reset_index()
-                financials_df['Date'] = financials_df['Date'].astype(str)
-                ticker_result["financials"] = financials_df.to_dict(orient='list')
-
-            if "sustainability" in info_types:
-                sustainability_df = stock_info.sustainability.reset_index()
-                sustainability_df['Date'] = sustainability_df['Date'].astype(str)
-                ticker_result["sustainability"] = sustainability_df.to_dict(orient='list')
-
-            if "recommendations" in info_types:
-                rec = stock_info.recommendations
-                if isinstance(rec, pd.DataFrame):
-                    rec = rec.reset_index()
-                    rec['Date'] = rec['Date'].astype(str)
-                    ticker_result["recommendations"] = rec.to_dict(orient='list')
-                elif isinstance(rec, dict):
-                    ticker_result["recommendations"] = rec
-                else:
-                    ticker_result["recommendations"] = str(rec)
-
-            result[ticker] = ticker_result
-
-        except Exception as e:
-            result[ticker] = {"error": str(e)}
-
-    return result
+            return json.loads(response_text_no_urls)
+        except json.JSONDecodeError:
+            return {"error": "Failed to decode JSON", "response_text": response_text_no_urls}
+    elif response.status_code == 502:
+        return {"error": "502 Bad Gateway from Wolfram Alpha"}
+    return {"error": f"Failed to query Wolfram Alpha, received HTTP {response.status_code}"}
 
 
 async def query_wolfram_alpha(queries):
-    base_url = "https://www.wolframalpha.com/api/v1/llm-api"
+    """Run every query concurrently (up to WOLFRAM_CONCURRENCY at once) and return {query: result}."""
     wolfram_id = os.getenv('WOLFRAM_ID')
     if wolfram_id is None:
         raise ValueError("No WOLFRAM_ID found. Please set the WOLFRAM_ID environment variable.")
-    results = {}
+    if isinstance(queries, str):
+        queries = [queries]
+    queries = list(dict.fromkeys(queries))
 
-    def remove_urls(text):
-        return re.sub(r'http\S+', '', text)
-
-    async with httpx.AsyncClient() as client:
-        for query in queries:
-            params = {
-                "input": query,
-                "appid": wolfram_id
-            }
-            response = await client.get(base_url, params=params)
-            response_text_no_urls = remove_urls(response.text)
-            if response.status_code == 200:
-                try:
-                    results[query] = json.loads(response_text_no_urls)
-                except json.JSONDecodeError:
-                    results[query] = {"error": "Failed to decode JSON", "response_text": response_text_no_urls}
-            elif response.status_code == 502:
-                results[query] = {"error": "502 Bad Gateway from Wolfram Alpha"}
-            else:
-                results[query] = {"error": f"Failed to query Wolfram Alpha, received HTTP {response.status_code}"}
+    client = get_http_client(WOLFRAM_API_URL)
+    responses = await asyncio.gather(*(_wolfram_query(client, query, wolfram_id) for query in queries),
+                                     return_exceptions=True)
 
+    results = {}
+    for query, result in zip(queries, responses):
+        if isinstance(result, asyncio.TimeoutError):
+            result = {"error": f"Wolfram Alpha timed out after {WOLFRAM_TIMEOUT} seconds"}
+        elif isinstance(result, Exception):
+            result = {"error": str(result)}
+        results[query] = result
     return results
 
 
-async def get_crypto_info_from_coinmarketcap(token_symbol: str):
-    api_key = os.environ.get('CMC_API_KEY')
-    headers = {
-        'Accepts': 'application/json',
-        'X-CMC_PRO_API_KEY': api_key,
-    }
-  
-    # Function to get basic information such as price, volume, supply, etc.
-    async def get_basic_info(symbol):
-        url = "https://pro-api.coinmarketcap.com/v1/cryptocurrency/quotes/latest"
-        params = {'symbol': symbol, 'convert': 'USD'}
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url, headers=headers, params=params)
-            if response.status_code != 200:
-                return None
-            return response.json().get('data', {}).get(symbol.upper(), {})
-  
-    # Function to get metadata like descriptions, logo, etc.
-    async def get_metadata(symbol):
-        url = "https://pro-api.coinmarketcap.com/v1/cryptocurrency/info"
-        params = {'symbol': symbol}
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url, headers=headers, params=params)
-            if response.status_code != 200:
-                return None
-            return response.json().get('data', {}).get(symbol.upper(), {})
-  
-    # Function to get market pair (exchange) information
-    async def get_market_pairs(symbol):
-        url = "https://pro-api.coinmarketcap.com/v1/cryptocurrency/market-pairs/latest"
-        params = {'symbol': symbol}
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url, headers=headers, params=params)
-            if response.status_code != 200:
-                return None
-            return response.json().get('data', {}).get('market_pairs', [])
-  
-    # Call the above functions asynchronously
-    basic_info = await get_basic_info(token_symbol)
-    metadata = await get_metadata(token_symbol)
-    market_pairs_response = await get_market_pairs(token_symbol)
-  
+def _symbol_list(token_symbol=None, token_symbols=None):
+    # Accept "BTC", "BTC,ETH", ["BTC", "ETH"] or any mix, de-duplicated in order
+    raw = []
+    for value in (token_symbol, token_symbols):
+        if isinstance(value, str):
+            raw.extend(value.split(","))
+        elif value:
+            raw.extend(value)
+    return list(dict.fromkeys(symbol.strip().upper() for symbol in raw if symbol and symbol.strip()))
+
+
+def _summarize_crypto(basic_info, metadata, market_pairs):
     if not basic_info:
         return "Failed to retrieve basic info"
-  
+
     quote = basic_info.get('quote', {}).get('USD', {})
     market_cap = quote.get('market_cap')
     current_price = quote.get('price')
@@ -147,16 +105,16 @@ async def get_crypto_info_from_coinmarketcap(token_symbol: str):
     circulating_supply = basic_info.get('circulating_supply')
     total_supply = basic_info.get('total_supply')
     undiluted_market_cap = current_price * total_supply if current_price and total_supply else None
-  
+
     # Check if metadata is None before trying to access its properties
     description = metadata.get('description') if metadata else None
     logo = metadata.get('logo') if metadata else None
     urls = metadata.get('urls', {}) if metadata else {}
-  
+
     # Extract exchange information from market pairs
-    exchanges = [pair['exchange']['name'] for pair in market_pairs_response] if market_pairs_response else []
-  
-    result = {
+    exchanges = [pair['exchange']['name'] for pair in market_pairs] if market_pairs else []
+
+    return {
         'market_cap': market_cap,
         'current_price': current_price,
         'total_volume': total_volume,
@@ -168,44 +126,99 @@ async def get_crypto_info_from_coinmarketcap(token_symbol: str):
         'urls': urls,
         'exchanges': exchanges,
     }
-  
-    return result
 
 
+@cached('get_crypto_info_from_coinmarketcap', ttl=PRICE_TTL)
+async def get_crypto_info_from_coinmarketcap(token_symbol: str = None, token_symbols: list = None):
+    """
+    Look up one or more tokens on CoinMarketCap.
+
+    `token_symbol` may be a single symbol or a comma-separated list; `token_symbols`
+    takes a list. Quotes and metadata for every symbol come from one request per
+    endpoint. A single symbol returns its info dict, several return {symbol: info}.
+    """
+    symbols = _symbol_list(token_symbol, token_symbols)
+    if not symbols:
+        return "No token symbol given"
+
+    api_key = os.environ.get('CMC_API_KEY')
+    headers = {
+        'Accepts': 'application/json',
+        'X-CMC_PRO_API_KEY': api_key,
+    }
+
+    async def get_data(endpoint, params):
+        url = f"{CMC_BASE_URL}/{endpoint}"
+        client = get_http_client(url)
+        response = await client.get(url, headers=headers, params=params)
+        if response.status_code != 200:
+            return None
+        return response.json().get('data', {})
+
+    # Basic information such as price, volume, supply, etc. for all symbols at once
+    async def get_basic_info(symbols):
+        return await get_data("quotes/latest", {'symbol': ",".join(symbols), 'convert': 'USD', 'skip_invalid': 'true'}) or {}
+
+    # Metadata like descriptions, logo, etc. for all symbols at once
+    async def get_metadata(symbols):
+        return await get_data("info", {'symbol': ",".join(symbols), 'skip_invalid': 'true'}) or {}
+
+    # Market pair (exchange) information; this endpoint only takes one symbol
+    async def get_market_pairs(symbol):
+        data = await get_data("market-pairs/latest", {'symbol': symbol})
+        return data.get('market_pairs', []) if data else None
+
+    # Call the above functions concurrently
+    basic_info, metadata, *market_pairs = await asyncio.gather(
+        get_basic_info(symbols),
+        get_metadata(symbols),
+        *(get_market_pairs(symbol) for symbol in symbols),
+    )
+
+    results = {
+        symbol: _summarize_crypto(basic_info.get(symbol), metadata.get(symbol), pairs)
+        for symbol, pairs in zip(symbols, market_pairs)
+    }
+    if len(symbols) == 1:
+        return results[symbols[0]]
+    return results
+
+
+@cached('mediawiki_query', ttl=SEARCH_TTL)
 async def mediawiki_query(action, search_string):
-    url = "https://en.wikipedia.org/w/api.php"
+    url = WIKIPEDIA_API_URL
     params = {
         "action": action,
         "format": "json",
         "list": "search",
         "srsearch": search_string
     }
-    async with httpx.AsyncClient() as client:
-        response = await client.get(url, params=params)
-        data = response.json()
-        return data
+    client = get_http_client(url)
+    response = await client.get(url, params=params)
+    data = response.json()
+    return data
 
 
 
+@cached('generate_image_with_dalle', ttl=IMAGE_TTL)
 async def generate_image_with_dalle(prompt: str, size: Literal['1024x1024', '1024x1792', '1792x1024'], quality: Literal['standard', 'hd'] = 'standard'):
     """
-    Generates an original image based on a text prompt using DALL·E 3.
-    - `prompt`: The text prompt based on which DALL·E 3 will generate an image.
+    Generates an original image based on a text prompt using DALL-E 3.
+    - `prompt`: The text prompt based on which DALL-E 3 will generate an image.
     - `size`: The dimension of the generated image. Valid options are '1024x1024', '1024x1792', and '1792x1024'.
     - `quality`: The quality of the generated image, either 'standard' or 'hd'. Defaults to 'standard'.
-    """
 
-    # Initialize the OpenAI client (ensure your API key is set up correctly)
-    client = openai.OpenAI()
-
-    # Generate the image with DALL·E 3
-    response = client.images.generate(
-        model="dall-e-3",
-        prompt=prompt,
-        size=size,
-        quality=quality,
-        n=1,
-    )
+    Uses the shared async client, so generation never blocks the event loop, and at
+    most IMAGE_CONCURRENCY images are generated at once.
+    """
+    async with _image_semaphore:
+        response = await get_openai_client().images.generate(
+            model="dall-e-3",
+            prompt=prompt,
+            size=size,
+            quality=quality,
+            n=1,
+        )
 
     # Extract the URL of the generated image
     image_url = response.data[0].url
@@ -213,41 +226,77 @@ async def generate_image_with_dalle(prompt: str, size: Literal['1024x1024', '102
     return image_url
 
 
-async def query_arxiv(search_query, max_results=10):
+ATOM = "{http://www.w3.org/2005/Atom}"
+OPENSEARCH = "{http://a9.com/-/spec/opensearch/1.1/}"
+
+
+def _collapse(text):
+    # Titles and abstracts come hard-wrapped
+    return " ".join((text or "").split())
+
+
+def _arxiv_entry(entry):
+    return {
+        "id": entry.findtext(f"{ATOM}id", "").rsplit("/abs/", 1)[-1],
+        "title": _collapse(entry.findtext(f"{ATOM}title")),
+        "authors": [author.findtext(f"{ATOM}name", "") for author in entry.iter(f"{ATOM}author")],
+        "abstract": _collapse(entry.findtext(f"{ATOM}summary")),
+        "published": entry.findtext(f"{ATOM}published", ""),
+        "updated": entry.findtext(f"{ATOM}updated", ""),
+    }
+
+
+@cached('query_arxiv', ttl=REFERENCE_TTL)
+async def query_arxiv(search_query, max_results=10, start=0):
     """
-    Asynchronously query the arXiv API for papers matching the search query and return results as JSON.
-  
+    Asynchronously query the arXiv API for papers matching the search query.
+
+    The Atom feed is parsed incrementally as it downloads and only each paper's
+    id, title, authors, abstract and dates are kept.
+
     Parameters:
     search_query (str): The search query string.
     max_results (int): Maximum number of results to return.
-  
+    start (int): Index of the first result, for fetching further pages.
+
     Returns:
-    JSON: A JSON object containing the query results or an error message.
+    dict: The total number of matches and the requested page of papers, or an error message.
     """
-    base_url = "http://export.arxiv.org/api/query"
+    base_url = ARXIV_API_URL
     params = {
         "search_query": search_query,
-        "start": 0,  # Adjust if pagination is needed
+        "start": start,
         "max_results": max_results
     }
-  
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.get(base_url, params=params)
-            if response.status_code == 200:
-                # Convert XML response to Python dict and then to JSON
-                response_dict = xmltodict.parse(response.content)
-                return json.dumps(response_dict)  # Convert dict to JSON string
-            else:
-                return json.dumps({"error": f"Failed to query arXiv, received HTTP {response.status_code}"})
-        except Exception as e:
-            return json.dumps({"error": str(e)})
 
+    client = get_http_client(base_url)
+    parser = ElementTree.XMLPullParser(events=("end",))
+    papers = []
+    total_results = None
+    try:
+        async with client.stream("GET", base_url, params=params) as response:
+            if response.status_code != 200:
+                return {"error": f"Failed to query arXiv, received HTTP {response.status_code}"}
+            async for chunk in response.aiter_bytes():
+                parser.feed(chunk)
+                for _, element in parser.read_events():
+                    if element.tag == f"{ATOM}entry":
+                        papers.append(_arxiv_entry(element))
+                        element.clear()  # Keep memory flat for large pages
+                    elif element.tag == f"{OPENSEARCH}totalResults":
+                        total_results = int(element.text or 0)
+        parser.close()
+    except Exception as e:
+        return {"error": str(e)}
+    return {"total_results": total_results, "start": start, "papers": papers}
+
+@cached('get_trending_cryptos', ttl=TRENDING_TTL)
 async def get_trending_cryptos():
-    async with httpx.AsyncClient() as client:
-        response = await client.get('https://api.coingecko.com/api/v3/search/trending')
-        response.raise_for_status()
-        trending_data = response.json()
+    url = COINGECKO_TRENDING_URL
+    client = get_http_client(url)
+    response = await client.get(url)
+    response.raise_for_status()
+    trending_data = response.json()
     
     trending_coins = trending_data['coins']
     trending_list = []
@@ -259,4 +308,22 @@ async def get_trending_cryptos():
         }
         trending_list.append(coin_info)
     
-    return trending_list
\ No newline at end of file
+    return trending_list
+
+
+def compact_crypto_info(result):
+    def compact(info):
+        return {key: value for key, value in info.items() if key != "logo"} if isinstance(info, dict) else info
+    if isinstance(result, dict) and "market_cap" not in result:
+        return {symbol: compact(info) for symbol, info in result.items()}
+    return compact(result)
+
+
+def compact_mediawiki(data):
+    query = data.get("query") if isinstance(data, dict) else None
+    if not isinstance(query, dict) or "search" not in query:
+        return data
+    results = [{"title": item.get("title"), "snippet": re.sub(r"<[^>]+>", "", item.get("snippet", "")),
+                "timestamp": item.get("timestamp")}
+               for item in query.get("search", [])]
+    return {"total_hits": query.get("searchinfo", {}).get("totalhits"), "results": results}
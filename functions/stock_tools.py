@@ -0,0 +1,132 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import yfinance as yf
+
+from functions.function_calls import PRICE_TTL, REFERENCE_TTL
+from utils.cache import cached
+from utils.tool_output import pick, recent_window
+
+# yfinance and pandas block, so all of their work runs on this bounded pool
+STOCK_WORKERS = int(os.getenv('STOCK_WORKERS', '4'))
+_stock_executor = ThreadPoolExecutor(max_workers=STOCK_WORKERS, thread_name_prefix='yfinance')
+
+
+def _stock_ttl(tickers=None, info_types=(), **kwargs):
+    # Prices go stale fast, fundamentals and company metadata don't
+    return PRICE_TTL if "current_price" in (info_types or ()) else REFERENCE_TTL
+
+
+def _frame_to_dict(frame):
+    """Convert a yfinance Series/DataFrame to JSON-friendly lists, column-wise."""
+    if isinstance(frame, pd.Series):
+        frame = frame.to_frame()
+    frame = frame.reset_index()
+    frame.columns = [str(column) for column in frame.columns]
+    date_columns = frame.select_dtypes(include=['datetime', 'datetimetz']).columns
+    if len(date_columns):
+        frame[date_columns] = frame[date_columns].astype(str)
+    return frame.to_dict(orient='list')
+
+
+def _bulk_current_prices(tickers):
+    # One download for every ticker instead of a history() call per ticker
+    data = yf.download(tickers, period="1d", progress=False, threads=True, auto_adjust=False)
+    if data.empty:
+        return {}
+    close = data["Close"]
+    if isinstance(close, pd.Series):
+        close = close.to_frame(name=tickers[0])
+    last = close.ffill().iloc[-1]
+    return {ticker: float(price) for ticker, price in last.items() if pd.notna(price)}
+
+
+def _ticker_details(ticker, info_types):
+    stock_info = yf.Ticker(ticker)
+    ticker_result = {}
+
+    if "dividends" in info_types:
+        ticker_result["dividends"] = _frame_to_dict(stock_info.dividends)
+
+    if "splits" in info_types:
+        ticker_result["splits"] = _frame_to_dict(stock_info.splits)
+
+    if "company_info" in info_types:
+        ticker_result["company_info"] = stock_info.info
+
+    if "financials" in info_types:
+        ticker_result["financials"] = _frame_to_dict(stock_info.financials)
+
+    if "sustainability" in info_types:
+        ticker_result["sustainability"] = _frame_to_dict(stock_info.sustainability)
+
+    if "recommendations" in info_types:
+        rec = stock_info.recommendations
+        if isinstance(rec, pd.DataFrame):
+            ticker_result["recommendations"] = _frame_to_dict(rec)
+        elif isinstance(rec, dict):
+            ticker_result["recommendations"] = rec
+        else:
+            ticker_result["recommendations"] = str(rec)
+
+    return ticker_result
+
+
+@cached('get_stock_info', ttl=_stock_ttl)
+async def get_stock_info(tickers, info_types):
+    if isinstance(tickers, str):
+        tickers = [tickers]
+    # yf.download keys its columns by upper-case symbol, so "aapl" must become "AAPL"
+    tickers = list(dict.fromkeys(ticker.strip().upper() for ticker in tickers if ticker and ticker.strip()))
+    loop = asyncio.get_running_loop()
+    detail_types = [info_type for info_type in info_types if info_type != "current_price"]
+
+    # Bulk price download and per-ticker details all run in parallel off the event loop
+    price_job = (loop.run_in_executor(_stock_executor, _bulk_current_prices, list(tickers))
+                 if "current_price" in info_types else asyncio.sleep(0, result={}))
+    detail_jobs = [loop.run_in_executor(_stock_executor, _ticker_details, ticker, detail_types)
+                   if detail_types else asyncio.sleep(0, result={})
+                   for ticker in tickers]
+    prices, *details = await asyncio.gather(price_job, *detail_jobs, return_exceptions=True)
+
+    result = {}
+    for ticker, ticker_result in zip(tickers, details):
+        if isinstance(ticker_result, Exception):
+            result[ticker] = {"error": str(ticker_result)}
+            continue
+        if "current_price" in info_types:
+            if isinstance(prices, Exception):
+                result[ticker] = {"error": str(prices)}
+                continue
+            if ticker not in prices:
+                result[ticker] = {"error": f"No price data found for {ticker}"}
+                continue
+            ticker_result = {"current_price": prices[ticker], **ticker_result}
+        result[ticker] = ticker_result
+
+    return result
+
+
+# Fields of yfinance's company info worth sending to the model; the rest is noise
+COMPANY_INFO_FIELDS = (
+    "longName", "symbol", "sector", "industry", "country", "website", "currency",
+    "marketCap", "enterpriseValue", "trailingPE", "forwardPE", "priceToBook", "trailingEps",
+    "dividendYield", "payoutRatio", "beta", "fiftyTwoWeekLow", "fiftyTwoWeekHigh",
+    "totalRevenue", "revenueGrowth", "profitMargins", "fullTimeEmployees", "longBusinessSummary",
+)
+STOCK_SERIES = ("dividends", "splits", "recommendations")
+
+
+def compact_stock_info(result):
+    compacted = {}
+    for ticker, ticker_result in result.items():
+        ticker_result = dict(ticker_result)
+        for series in STOCK_SERIES:
+            if series in ticker_result:
+                ticker_result[series] = recent_window(ticker_result[series])
+        if "company_info" in ticker_result:
+            ticker_result["company_info"] = pick(ticker_result["company_info"], COMPANY_INFO_FIELDS)
+        compacted[ticker] = ticker_result
+    return compacted
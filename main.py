@@ -19,35 +19,47 @@
 # http://www.sshift.xyz
 #
 import logging
-import logging.handlers
+import multiprocessing
 import os
 
-import nextcord
 from nextcord.ext import commands
 
-from database.user_database import create_table
+from database import user_database
 from server import keep_alive
-
-
-def setup_logging():
-  """Configure logging for the bot."""
-  logger = logging.getLogger('discord')
-  logger.setLevel(logging.DEBUG)
-
-  handler = logging.handlers.RotatingFileHandler(filename='discord.log',
-                                                 encoding='utf-8',
-                                                 maxBytes=10**7,
-                                                 backupCount=1)
-  console_handler = logging.StreamHandler()
-
-  fmt = logging.Formatter('[%(asctime)s] %(levelname)s: %(message)s')
-  handler.setFormatter(fmt)
-  console_handler.setFormatter(fmt)
-
-  logger.addHandler(handler)
-  logger.addHandler(console_handler)
-
-  return logger
+from utils.cache import tool_cache
+from utils.gateway_profile import GATEWAY_PROFILE, gateway_options, install_channel_filter
+from utils.http_clients import close_http_clients
+from utils.logging_setup import setup_logging
+from utils.openai_client import close_openai_client
+
+# Sharding: SHARD_COUNT gateway shards (Discord's recommendation when unset),
+# spread over SHARD_PROCESSES worker processes that each run their own bot
+SHARD_COUNT = int(os.getenv('SHARD_COUNT', '0')) or None
+SHARD_PROCESSES = int(os.getenv('SHARD_PROCESSES', '1'))
+PORT = int(os.getenv('PORT', '8080'))  # Worker N serves /metrics on PORT + N
+
+
+class HeliusBot(commands.AutoShardedBot):
+  """AutoShardedBot that owns the shared database connection, pools and caches."""
+
+  def __init__(self, *args, drop_unserved_events=False, **kwargs):
+    super().__init__(*args, **kwargs)
+    self.served_channel_ids = set()  # Filled in by cogs
+    if drop_unserved_events:
+      install_channel_filter(self._connection.parsers, lambda: self.served_channel_ids)
+
+  async def start(self, *args, **kwargs):
+    # Open the shared database connection (and create tables) before connecting
+    await user_database.connect()
+    logging.getLogger('discord').info('Database initialized.')
+    await super().start(*args, **kwargs)
+
+  async def close(self):
+    await super().close()
+    await user_database.close()
+    await close_http_clients()
+    await close_openai_client()
+    await tool_cache.close()
 
 def load_cogs(bot, logger):
   """Load all cogs from the cogs directory."""
@@ -63,25 +75,47 @@ def load_cogs(bot, logger):
       except Exception as e:
         logger.error(f"Failed to load cog: {cog_path}. Error: {e}")
 
-# Set up logging
-logger = setup_logging()
-
-# Create an Intents object with all intents enabled
-intents = nextcord.Intents.all()
-bot = commands.Bot(command_prefix="!", intents=intents, help_command=None)
-
-@bot.event
-async def on_ready():
-  logger.info(f'Logged in as {bot.user.name}!')
-
-  # Initialize the database
-  await create_table()
-  logger.info('Database initialized.')
-
-# Load cogs
-load_cogs(bot, logger)
-
-keep_alive()
-
-# Start the bot
-bot.run(os.getenv('DISCORD_TOKEN'))
\ No newline at end of file
+def shard_ranges(shard_count, processes):
+  """Split shard ids 0..shard_count-1 into contiguous ranges, one per process."""
+  return [list(range(shard_count * index // processes, shard_count * (index + 1) // processes))
+          for index in range(processes)]
+
+def run_bot(process_index=0, shard_ids=None, shard_count=SHARD_COUNT):
+  """Run one bot, connected to `shard_ids` of `shard_count` (all shards when None)."""
+  # Each worker logs to its own file; rotating one file from several processes isn't safe
+  logger = setup_logging('discord.log' if process_index == 0 else f'discord-{process_index}.log')
+
+  # GATEWAY_PROFILE=lean (default) only subscribes to and caches what the cogs use
+  bot = HeliusBot(command_prefix="!", help_command=None, shard_ids=shard_ids, shard_count=shard_count,
+                  drop_unserved_events=GATEWAY_PROFILE == 'lean', **gateway_options(GATEWAY_PROFILE))
+
+  @bot.event
+  async def on_ready():
+    logger.info(f'Logged in as {bot.user.name} (shards {shard_ids or "all"})!')
+
+  # Load cogs
+  load_cogs(bot, logger)
+
+  keep_alive(PORT + process_index)
+
+  # Start the bot
+  bot.run(os.getenv('DISCORD_TOKEN'))
+
+def run_sharded(processes, shard_count):
+  """Start one bot process per shard range and wait for all of them."""
+  # Conversations can now be served by several processes; order them through user_threads.db
+  os.environ['THREAD_LEASES'] = '1'
+  processes = min(processes, shard_count)
+  context = multiprocessing.get_context('spawn')
+  workers = [context.Process(target=run_bot, args=(index, shard_ids, shard_count), name=f'helius-{index}')
+             for index, shard_ids in enumerate(shard_ranges(shard_count, processes))]
+  for worker in workers:
+    worker.start()
+  for worker in workers:
+    worker.join()
+
+if __name__ == "__main__":
+  if SHARD_PROCESSES > 1:
+    run_sharded(SHARD_PROCESSES, SHARD_COUNT or SHARD_PROCESSES)
+  else:
+    run_bot()
@@ -1,19 +1,25 @@
 from threading import Thread
 
-from flask import Flask
+from flask import Flask, Response
 from waitress import serve
 
+from utils.metrics import render
+
 app = Flask(__name__)
 
 @app.route('/')
 def home():
   return "I'm Alive"
 
-def run():
-  serve(app, host='0.0.0.0', port=8080)
+@app.route('/metrics')
+def metrics():
+  return Response(render(), mimetype='text/plain; version=0.0.4')
+
+def run(port=8080):
+  serve(app, host='0.0.0.0', port=port)
 
-def keep_alive():
-  t = Thread(target=run)
+def keep_alive(port=8080):
+  t = Thread(target=run, args=(port,))
   t.start()
 
 if __name__ == "__main__":
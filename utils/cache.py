@@ -0,0 +1,290 @@
+import asyncio
+import functools
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+
+import aiosqlite
+
+from utils.metrics import register_gauge
+
+logger = logging.getLogger('discord')
+
+TOOL_CACHE_SIZE = int(os.getenv('TOOL_CACHE_SIZE', '2048'))
+TOOL_CACHE_DB = os.getenv('TOOL_CACHE_DB')  # e.g. 'database/tool_cache.db' to persist across restarts
+TOOL_CACHE_DB_MAX_ROWS = int(os.getenv('TOOL_CACHE_DB_MAX_ROWS', '50000'))
+TOOL_CACHE_DB_SWEEP_SECONDS = float(os.getenv('TOOL_CACHE_DB_SWEEP_SECONDS', '60'))  # Between expiry sweeps
+
+_MISSING = object()
+
+
+class LRUCache:
+    """Size-bounded LRU map with optional per-entry TTL and hit/miss counters."""
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self._data = OrderedDict()  # key -> (expires_at or None, value)
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING, count=False) is not _MISSING
+
+    def get(self, key, default=None, count=True):
+        entry = self._data.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at is None or expires_at > time.monotonic():
+                self._data.move_to_end(key)
+                if count:
+                    self.hits += 1
+                return value
+            del self._data[key]
+        if count:
+            self.misses += 1
+        return default
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        self._data[key] = (expires_at, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        entry = self._data.pop(key, None)
+        return entry[1] if entry is not None else default
+
+    def clear(self):
+        self._data.clear()
+
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+class MemoryBackend:
+    """In-process LRU tier."""
+
+    def __init__(self, maxsize=TOOL_CACHE_SIZE):
+        self.lru = LRUCache(maxsize)
+
+    async def get(self, key):
+        # Memory is the first tier and never promoted into, so its expiry isn't needed
+        return self.lru.get(key, _MISSING, count=False), None
+
+    async def set(self, key, value, ttl):
+        self.lru.set(key, value, ttl)
+
+    async def close(self):
+        self.lru.clear()
+
+
+class SQLiteBackend:
+    """
+    On-disk tier so the cache survives restarts. Values are stored as JSON.
+
+    Every argument combination gets its own row, so at most every `sweep_interval`
+    seconds a write also deletes expired rows and, past `max_rows`, the rows that
+    expire soonest. The first write after start-up sweeps what a previous run left.
+    """
+
+    def __init__(self, path, max_rows=TOOL_CACHE_DB_MAX_ROWS, sweep_interval=TOOL_CACHE_DB_SWEEP_SECONDS):
+        self.path = path
+        self.max_rows = max_rows
+        self.sweep_interval = sweep_interval
+        self._db = None
+        self._lock = asyncio.Lock()
+        self._next_sweep = 0.0
+
+    async def _connect(self):
+        async with self._lock:
+            if self._db is None:
+                self._db = await aiosqlite.connect(self.path)
+                await self._db.execute("PRAGMA journal_mode=WAL")
+                await self._db.execute("""
+                CREATE TABLE IF NOT EXISTS tool_cache (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                );
+                """)
+                await self._db.execute("CREATE INDEX IF NOT EXISTS tool_cache_expires_at ON tool_cache (expires_at)")
+                await self._db.commit()
+        return self._db
+
+    async def get(self, key):
+        db = await self._connect()
+        async with db.execute("SELECT value, expires_at FROM tool_cache WHERE key = ?", (key,)) as cursor:
+            row = await cursor.fetchone()
+        if row is None or row[1] <= time.time():
+            return _MISSING, None
+        return json.loads(row[0]), row[1]
+
+    async def set(self, key, value, ttl):
+        db = await self._connect()
+        now = time.time()
+        await db.execute("""
+            INSERT INTO tool_cache (key, value, expires_at) VALUES (?, ?, ?)
+            ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at;
+        """, (key, json.dumps(value, default=str), now + ttl))
+        if now >= self._next_sweep:
+            self._next_sweep = now + self.sweep_interval
+            await self._sweep(db, now)
+        await db.commit()
+
+    async def _sweep(self, db, now):
+        cursor = await db.execute("DELETE FROM tool_cache WHERE expires_at <= ?", (now,))
+        expired = cursor.rowcount
+        cursor = await db.execute("""
+            DELETE FROM tool_cache WHERE key IN (
+                SELECT key FROM tool_cache ORDER BY expires_at DESC LIMIT -1 OFFSET ?
+            );
+        """, (self.max_rows,))
+        if expired or cursor.rowcount:
+            logger.info(f"Tool cache sweep removed {expired} expired and {cursor.rowcount} excess rows.")
+
+    async def close(self):
+        if self._db is not None:
+            await self._db.close()
+            self._db = None
+
+
+def _retrieve_exception(task):
+    # Mark a failed fill as retrieved even when every waiter has gone
+    if not task.cancelled():
+        task.exception()
+
+
+def _is_failure(value):
+    return (isinstance(value, dict) and "error" in value) or (isinstance(value, str) and value.startswith("Failed"))
+
+
+def _is_cacheable(value):
+    # Don't pin upstream failures for a whole TTL, including partial ones such as
+    # one ticker or symbol of a multi-item lookup ({"AAPL": {...}, "XYZ": {"error": ...}})
+    if _is_failure(value):
+        return False
+    if isinstance(value, dict):
+        return not any(_is_failure(item) for item in value.values())
+    return True
+
+
+class ToolCache:
+    """
+    Async read-through cache for tool results.
+
+    Looks a key up in each backend tier in order (memory first, then disk when
+    configured). A backend's get returns the value and its wall-clock expiry, so a
+    disk hit is promoted into memory only for the time it has left. Concurrent
+    identical calls are de-duplicated: only the first one reaches upstream and the
+    rest await its result. Hits, misses and coalesced calls are counted per tool.
+    """
+
+    def __init__(self, backends):
+        self.backends = backends
+        self._inflight = {}
+        self._stats = {}
+
+    def _counters(self, name):
+        return self._stats.setdefault(name, {"hits": 0, "misses": 0, "coalesced": 0})
+
+    async def _lookup(self, key):
+        for index, backend in enumerate(self.backends):
+            value, expires_at = await backend.get(key)
+            if value is not _MISSING:
+                return index, value, expires_at
+        return None, _MISSING, None
+
+    async def get_or_call(self, name, key, ttl, call):
+        counters = self._counters(name)
+        tier, value, expires_at = await self._lookup(key)
+        if value is not _MISSING:
+            counters["hits"] += 1
+            # Promote disk hits into memory for what's left of their TTL, not a fresh one
+            remaining = ttl if expires_at is None else expires_at - time.time()
+            if remaining > 0:
+                for backend in self.backends[:tier]:
+                    await backend.set(key, value, remaining)
+            return value
+
+        task = self._inflight.get(key)
+        if task is not None:
+            counters["coalesced"] += 1
+        else:
+            counters["misses"] += 1
+            # The upstream call runs in its own task, so a caller that times out or is
+            # cancelled never takes the shared result down with it for the other waiters
+            task = asyncio.create_task(self._fill(name, key, ttl, call))
+            self._inflight[key] = task
+            task.add_done_callback(_retrieve_exception)
+        return await asyncio.shield(task)
+
+    async def _fill(self, name, key, ttl, call):
+        try:
+            value = await call()
+        finally:
+            self._inflight.pop(key, None)
+        if _is_cacheable(value):
+            for backend in self.backends:
+                try:
+                    await backend.set(key, value, ttl)
+                except Exception as e:
+                    logger.warning(f"Failed to store {name} result in cache: {e}")
+        return value
+
+    def cached(self, name, ttl):
+        """
+        Decorate an async tool so its results are cached for `ttl` seconds.
+
+        `ttl` may also be a callable receiving the call's keyword arguments, for
+        tools whose freshness depends on what was asked.
+        """
+        def decorator(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                key = f"{name}:{json.dumps([args, kwargs], sort_keys=True, default=str)}"
+                seconds = ttl(**kwargs) if callable(ttl) else ttl
+                return await self.get_or_call(name, key, seconds, lambda: func(*args, **kwargs))
+            return wrapper
+        return decorator
+
+    def stats(self):
+        # Called from the metrics thread too; copy before iterating as tools are first seen
+        stats = {name: dict(counters) for name, counters in list(self._stats.items())}
+        for counters in stats.values():
+            lookups = counters["hits"] + counters["misses"] + counters["coalesced"]
+            counters["hit_rate"] = (counters["hits"] + counters["coalesced"]) / lookups if lookups else 0.0
+        return stats
+
+    async def close(self):
+        inflight = list(self._inflight.values())
+        for task in inflight:
+            task.cancel()
+        await asyncio.gather(*inflight, return_exceptions=True)
+        for backend in self.backends:
+            await backend.close()
+
+
+def _default_backends():
+    backends = [MemoryBackend(TOOL_CACHE_SIZE)]
+    if TOOL_CACHE_DB:
+        backends.append(SQLiteBackend(TOOL_CACHE_DB))
+    return backends
+
+
+tool_cache = ToolCache(_default_backends())
+cached = tool_cache.cached
+
+register_gauge(
+    'helius_tool_cache_requests_total', 'Tool cache lookups by tool and result.',
+    lambda: [({"tool": name, "result": result}, counters[result])
+             for name, counters in tool_cache.stats().items()
+             for result in ("hits", "misses", "coalesced")],
+    metric_type="counter",
+)
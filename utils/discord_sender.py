@@ -0,0 +1,168 @@
+import asyncio
+import logging
+import os
+from collections import deque
+
+from utils.cache import LRUCache
+
+logger = logging.getLogger('discord')
+
+DISCORD_MESSAGE_LIMIT = 2000
+# Discord allows roughly 5 messages per 5 seconds in a channel; stay just inside it
+CHANNEL_RATE_LIMIT = int(os.getenv('CHANNEL_RATE_LIMIT', '5'))
+CHANNEL_RATE_PERIOD = float(os.getenv('CHANNEL_RATE_PERIOD', '5.2'))
+
+_FENCE_CLOSE = "\n```"
+_MAX_FENCE_LANGUAGE = 20  # Longest language carried into a reopened code block
+
+
+def _fence_after(text, fence):
+    """Return the open code fence language after `text` (None when outside a code block)."""
+    for line in text.split("\n"):
+        stripped = line.strip()
+        if not stripped.startswith("```"):
+            continue
+        info = stripped.lstrip("`").strip()
+        if fence is not None:
+            if not info:
+                fence = None  # A closing fence has nothing after its backticks
+        elif "`" not in info:
+            # Backticks in the info string make it inline code, e.g. ```print(1)```
+            fence = info.split()[0][:_MAX_FENCE_LANGUAGE] if info else ""
+    return fence
+
+
+def _find_cut(text, budget, fence):
+    """Pick where to end the next chunk: paragraph, then line, then code line, then word."""
+    best = {}
+    position = 0
+    for line in text[:budget].splitlines(keepends=True):
+        if not line.endswith("\n"):
+            break
+        position += len(line)
+        fence = _fence_after(line, fence)
+        if fence is not None:
+            best["code_line"] = position
+        elif not line.strip():
+            best["paragraph"] = position
+        else:
+            best["line"] = position
+    for kind in ("paragraph", "line", "code_line"):
+        if kind in best and best[kind] >= budget // 3:
+            return best[kind]
+    space = text.rfind(" ", 0, budget)
+    return space + 1 if space > budget // 3 else budget
+
+
+def split_message(text, limit=DISCORD_MESSAGE_LIMIT):
+    """
+    Split markdown into Discord-sized chunks.
+
+    Chunks end on paragraph or line breaks where possible, never mid-word unless a
+    single word is longer than the limit. A code block that has to be split is
+    closed at the end of one chunk and reopened, with its language, in the next.
+    """
+    chunks = []
+    fence = None
+    while text:
+        prefix = f"```{fence}\n" if fence is not None else ""
+        if len(prefix) + len(text) <= limit:
+            if text.strip():
+                chunks.append(prefix + text)
+            break
+        budget = max(1, limit - len(prefix) - len(_FENCE_CLOSE))
+        cut = _find_cut(text, budget, fence)
+        piece, text = text[:cut], text[cut:]
+        fence = _fence_after(piece, fence)
+        chunk = prefix + piece.rstrip("\n")
+        if fence is not None:
+            chunk += _FENCE_CLOSE
+        if chunk.strip():
+            chunks.append(chunk)
+    return chunks
+
+
+class ChannelBucket:
+    """Sliding-window limiter for one channel; waits instead of running into a 429."""
+
+    def __init__(self, limit=CHANNEL_RATE_LIMIT, period=CHANNEL_RATE_PERIOD):
+        self.limit = limit
+        self.period = period
+        self._sent = deque()
+        self._lock = asyncio.Lock()
+
+    def _expire(self, now):
+        while self._sent and now - self._sent[0] >= self.period:
+            self._sent.popleft()
+
+    def is_full(self):
+        """Whether acquire() would have to wait right now."""
+        self._expire(asyncio.get_running_loop().time())
+        return len(self._sent) >= self.limit
+
+    async def acquire(self):
+        async with self._lock:
+            loop = asyncio.get_running_loop()
+            while True:
+                now = loop.time()
+                self._expire(now)
+                if len(self._sent) < self.limit:
+                    self._sent.append(now)
+                    return
+                await asyncio.sleep(self._sent[0] + self.period - now)
+
+
+class OutboundSender:
+    """
+    Sends and edits bot messages through per-channel rate-limit buckets.
+
+    Edits have buckets of their own, as Discord limits them separately from new
+    messages, so a streamed reply being edited doesn't hold up other replies' sends.
+
+    Every message id of a reply is remembered per user, so a reply to any chunk of
+    a long answer is recognised with a single set lookup.
+    """
+
+    def __init__(self, max_channels=1000):
+        self._buckets = LRUCache(max_channels)
+        self._edit_buckets = LRUCache(max_channels)
+        self.reply_message_ids = {}  # user_id -> ids of the last reply sent to them
+        self.throttled = 0
+
+    def bucket(self, channel):
+        return self._channel_bucket(self._buckets, channel)
+
+    def edit_bucket(self, channel):
+        return self._channel_bucket(self._edit_buckets, channel)
+
+    @staticmethod
+    def _channel_bucket(buckets, channel):
+        bucket = buckets.get(channel.id, count=False)
+        if bucket is None:
+            bucket = ChannelBucket()
+            buckets.set(channel.id, bucket)
+        return bucket
+
+    async def send_chunk(self, channel, content):
+        bucket = self.bucket(channel)
+        if bucket.is_full():
+            self.throttled += 1
+        await bucket.acquire()
+        return await channel.send(content)
+
+    async def edit_chunk(self, channel, message, content):
+        await self.edit_bucket(channel).acquire()
+        return await message.edit(content=content)
+
+    def record_reply(self, user_id, messages):
+        self.reply_message_ids[user_id] = {message.id for message in messages}
+
+    def is_reply_to_bot(self, user_id, message_id):
+        return message_id in self.reply_message_ids.get(user_id, ())
+
+    async def send(self, channel, text, user_id=None):
+        """Send `text` as one or more messages, in order, and remember them for `user_id`."""
+        sent = [await self.send_chunk(channel, chunk) for chunk in split_message(text)]
+        if user_id is not None and sent:
+            self.record_reply(user_id, sent)
+        return sent
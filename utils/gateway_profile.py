@@ -0,0 +1,66 @@
+import logging
+import os
+
+import nextcord
+
+from utils.metrics import register_gauge
+
+logger = logging.getLogger('discord')
+
+# 'lean' subscribes to and caches only what the assistant cog uses; 'full' is Intents.all()
+GATEWAY_PROFILE = os.getenv('GATEWAY_PROFILE', 'lean')
+MESSAGE_CACHE_SIZE = int(os.getenv('MESSAGE_CACHE_SIZE', '100'))  # Messages kept for edits/deletes/replies
+
+# Channel-scoped events that are dropped before nextcord parses them when the channel isn't served
+CHANNEL_EVENTS = (
+    'MESSAGE_CREATE', 'MESSAGE_UPDATE', 'MESSAGE_DELETE', 'MESSAGE_DELETE_BULK', 'TYPING_START',
+    'MESSAGE_REACTION_ADD', 'MESSAGE_REACTION_REMOVE', 'MESSAGE_REACTION_REMOVE_ALL',
+    'MESSAGE_REACTION_REMOVE_EMOJI',
+)
+
+dropped_events = {}  # event name -> count
+
+
+def gateway_options(profile=GATEWAY_PROFILE):
+    """Keyword arguments for the bot constructor for the given gateway profile."""
+    if profile == 'full':
+        return {"intents": nextcord.Intents.all()}
+    intents = nextcord.Intents.none()
+    intents.guilds = True  # Channel and guild lookups for incoming messages
+    intents.guild_messages = True
+    intents.message_content = True
+    return {
+        "intents": intents,
+        "member_cache_flags": nextcord.MemberCacheFlags.none(),
+        "max_messages": MESSAGE_CACHE_SIZE,
+        "chunk_guilds_at_startup": False,
+    }
+
+
+def install_channel_filter(parsers, served_channel_ids):
+    """
+    Wrap the connection's raw event parsers so events from channels we don't serve
+    are dropped before any Message, Member or cache entry is built for them.
+
+    `served_channel_ids` is called for the current set of channel ids; while it's
+    empty nothing is dropped.
+    """
+    for event in CHANNEL_EVENTS:
+        parse = parsers.get(event)
+        if parse is not None:
+            parsers[event] = _drop_unserved(event, parse, served_channel_ids)
+
+
+def _drop_unserved(event, parse, served_channel_ids):
+    def parse_if_served(data):
+        channels = served_channel_ids()
+        if channels and int(data.get('channel_id') or 0) not in channels:
+            dropped_events[event] = dropped_events.get(event, 0) + 1
+            return None
+        return parse(data)
+    return parse_if_served
+
+
+register_gauge('helius_gateway_events_dropped_total', 'Gateway events dropped because their channel is not served.',
+               lambda: [({"event": event}, count) for event, count in list(dropped_events.items())],
+               metric_type="counter")
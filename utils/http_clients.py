@@ -0,0 +1,74 @@
+import importlib.util
+import logging
+import os
+
+import httpx
+
+from utils.metrics import register_gauge
+
+logger = logging.getLogger('discord')
+
+# Pool limits for each upstream host used by the tools
+HTTP_MAX_CONNECTIONS = int(os.getenv('HTTP_MAX_CONNECTIONS', '20'))
+HTTP_MAX_KEEPALIVE = int(os.getenv('HTTP_MAX_KEEPALIVE', '10'))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv('HTTP_KEEPALIVE_EXPIRY', '60'))
+HTTP_TIMEOUT = float(os.getenv('HTTP_TIMEOUT', '20'))
+HTTP_CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', '5'))
+
+_clients = {}  # "scheme://host:port" -> httpx.AsyncClient
+
+
+def http2_available():
+    # httpx only speaks HTTP/2 when the optional `h2` package is installed
+    return importlib.util.find_spec('h2') is not None
+
+
+def _origin(url):
+    url = httpx.URL(url)
+    port = url.port or (443 if url.scheme == "https" else 80)
+    return f"{url.scheme}://{url.host}:{port}"
+
+
+def get_http_client(url):
+    """
+    Return the shared keep-alive client for the host of `url`.
+
+    Clients are created on first use and kept for the life of the process, so
+    warm tool calls reuse open connections instead of paying DNS, TCP and TLS
+    setup every time. HTTP/2 is negotiated with hosts that support it.
+    """
+    origin = _origin(url)
+    client = _clients.get(origin)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            http2=origin.startswith("https") and http2_available(),
+            limits=httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS,
+                                max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+                                keepalive_expiry=HTTP_KEEPALIVE_EXPIRY),
+            timeout=httpx.Timeout(HTTP_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+        )
+        _clients[origin] = client
+        logger.info(f"HTTP client pool opened for {origin}.")
+    return client
+
+
+def pool_stats():
+    """Open connections per upstream origin (reads httpcore's pool, best effort)."""
+    stats = {}
+    for origin, client in list(_clients.items()):
+        pool = getattr(getattr(client, "_transport", None), "_pool", None)
+        stats[origin] = len(getattr(pool, "connections", ()))
+    return stats
+
+
+register_gauge('helius_http_pool_connections', 'Open pooled connections per upstream origin.',
+               lambda: [({"origin": origin}, count) for origin, count in pool_stats().items()])
+
+
+async def close_http_clients():
+    """Close every pooled client; called when the bot shuts down."""
+    clients = list(_clients.items())
+    _clients.clear()
+    for origin, client in clients:
+        await client.aclose()
+        logger.info(f"HTTP client pool closed for {origin}.")
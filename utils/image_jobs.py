@@ -0,0 +1,59 @@
+import asyncio
+import itertools
+import logging
+import os
+
+logger = logging.getLogger('discord')
+
+IMAGE_JOB_TIMEOUT = float(os.getenv('IMAGE_JOB_TIMEOUT', '180'))  # Seconds before a job is given up
+IMAGE_PENDING_TEXT = "Generating your image, it will appear here when it's ready..."
+
+
+class ImageJobs:
+    """
+    Runs image generation in the background so a run never waits on it.
+
+    `start` posts an acknowledgement in the channel straight away and returns a
+    job id for the tool output. A background task generates the image and edits
+    the acknowledgement into the result, or into an error if generation fails.
+    """
+
+    def __init__(self, generate, sender, timeout=IMAGE_JOB_TIMEOUT):
+        self.generate = generate  # async generate(**arguments) -> image url
+        self.sender = sender
+        self.timeout = timeout
+        self.counts = {"pending": 0, "done": 0, "failed": 0}
+        self._ids = itertools.count(1)
+        self._tasks = set()
+
+    async def start(self, channel, **arguments):
+        job_id = f"image-{next(self._ids)}"
+        ack = await self.sender.send_chunk(channel, IMAGE_PENDING_TEXT)
+        self.counts["pending"] += 1
+        task = asyncio.create_task(self._complete(job_id, channel, ack, arguments))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        logger.info(f"Image job {job_id} started.")
+        return job_id
+
+    async def _complete(self, job_id, channel, ack, arguments):
+        try:
+            image_url = await asyncio.wait_for(self.generate(**arguments), self.timeout)
+        except Exception as e:
+            self.counts["pending"] -= 1
+            self.counts["failed"] += 1
+            logger.error(f"Image job {job_id} failed: {e!r}")
+            await self.sender.edit_chunk(channel, ack, "Sorry, I couldn't generate that image.")
+            return
+        self.counts["pending"] -= 1
+        self.counts["done"] += 1
+        logger.info(f"Image job {job_id} finished.")
+        await self.sender.edit_chunk(channel, ack, image_url)
+
+    def stats(self):
+        return dict(self.counts)
+
+    async def close(self):
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
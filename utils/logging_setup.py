@@ -0,0 +1,75 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text')  # 'text' or 'json' (one object per line)
+LOG_CONSOLE = os.getenv('LOG_CONSOLE', '1') == '1'
+# Share of user messages whose content is logged; the rest are logged without it
+LOG_MESSAGE_CONTENT_SAMPLE = float(os.getenv('LOG_MESSAGE_CONTENT_SAMPLE', '0'))
+
+# Attributes every LogRecord has; anything else came in through `extra=`
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, including any fields passed with `extra=`."""
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update({key: value for key, value in vars(record).items() if key not in _RECORD_ATTRS})
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """The usual one-line format, with `extra=` fields appended as key=value."""
+
+    def format(self, record):
+        line = super().format(record)
+        extra = " ".join(f"{key}={value}" for key, value in vars(record).items() if key not in _RECORD_ATTRS)
+        return f"{line} [{extra}]" if extra else line
+
+
+def setup_logging(filename='discord.log'):
+    """
+    Configure the 'discord' logger with a single queue-backed sink.
+
+    Loggers only put records on an in-memory queue; a QueueListener thread does the
+    formatting, file writes and rotation, so a slow disk never blocks the event loop.
+    """
+    logger = logging.getLogger('discord')
+    logger.setLevel(LOG_LEVEL)
+
+    formatter = JsonFormatter() if LOG_FORMAT == 'json' else TextFormatter('[%(asctime)s] %(levelname)s: %(message)s')
+    handlers = [logging.handlers.RotatingFileHandler(filename=filename, encoding='utf-8',
+                                                     maxBytes=10**7, backupCount=1)]
+    if LOG_CONSOLE:
+        handlers.append(logging.StreamHandler())
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)  # Flush what's still queued on exit
+
+    logger.handlers.clear()
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    logger.propagate = False
+    return logger
+
+
+def sample_message_content():
+    """Whether this message's content should be logged (LOG_MESSAGE_CONTENT_SAMPLE)."""
+    return LOG_MESSAGE_CONTENT_SAMPLE > 0 and random.random() < LOG_MESSAGE_CONTENT_SAMPLE
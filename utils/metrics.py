@@ -0,0 +1,112 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger('discord')
+
+# Seconds; covers everything from a cache hit to a slow multi-tool run
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 40.0, 80.0)
+
+_metrics = []
+_gauges = {}  # name -> (documentation, collect, metric_type)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+
+class Histogram:
+    """
+    Thread-safe Prometheus-style histogram.
+
+    Observed from the event loop and rendered from the waitress thread serving
+    /metrics, so every update and read takes the lock.
+    """
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # label values -> [count per bucket..., sum, count]
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[index] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the time spent in the `with` block (works around awaits too)."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {key: list(values) for key, values in self._series.items()}
+        for key, values in sorted(series.items()):
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets, values):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels({**labels, 'le': bound})} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels({**labels, 'le': '+Inf'})} {values[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {values[-2]}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {values[-1]}")
+        return lines
+
+
+def register_gauge(name, documentation, collect, metric_type="gauge"):
+    """
+    Expose values computed at scrape time, e.g. cache or pool stats.
+
+    `collect` returns an iterable of (labels dict, value) pairs. Registering the
+    same name again replaces the previous collector, e.g. when a cog is reloaded.
+    """
+    _gauges[name] = (documentation, collect, metric_type)
+
+
+def render():
+    """Render every metric in the Prometheus text exposition format."""
+    lines = []
+    for metric in _metrics:
+        lines.extend(metric.render())
+    for name, (documentation, collect, metric_type) in list(_gauges.items()):
+        try:
+            samples = list(collect())
+        except Exception as e:
+            logger.warning(f"Failed to collect metric {name}: {e}")
+            continue
+        lines.append(f"# HELP {name} {documentation}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        lines.extend(f"{name}{_format_labels(labels)} {value}" for labels, value in samples)
+    return "\n".join(lines) + "\n"
+
+
+# Hot-path timings shared by the cog, scheduler, run driver and tool executor
+STAGE_SECONDS = Histogram('helius_stage_seconds', 'Time spent in each stage of handling a message.', ('stage',))
+TOOL_SECONDS = Histogram('helius_tool_seconds', 'Tool call duration by tool and outcome.', ('tool', 'outcome'))
+FIRST_TOKEN_SECONDS = Histogram('helius_time_to_first_token_seconds',
+                                'Time from starting a reply to the first text visible in Discord.')
+REPLY_SECONDS = Histogram('helius_reply_seconds', 'Time from dequeuing messages to the finished reply.')
@@ -0,0 +1,40 @@
+import logging
+import os
+
+import httpx
+import openai
+
+from utils.http_clients import http2_available
+
+logger = logging.getLogger('discord')
+
+# Connection pool sizing for the shared OpenAI client
+OPENAI_MAX_CONNECTIONS = int(os.getenv('OPENAI_MAX_CONNECTIONS', '100'))
+OPENAI_MAX_KEEPALIVE = int(os.getenv('OPENAI_MAX_KEEPALIVE', '20'))
+OPENAI_TIMEOUT = float(os.getenv('OPENAI_TIMEOUT', '60'))
+
+_client = None
+
+
+def get_openai_client():
+    """Return the process-wide `openai.AsyncOpenAI` client, creating it on first use."""
+    global _client
+    if _client is None:
+        http_client = httpx.AsyncClient(
+            http2=http2_available(),
+            limits=httpx.Limits(max_connections=OPENAI_MAX_CONNECTIONS,
+                                max_keepalive_connections=OPENAI_MAX_KEEPALIVE),
+            timeout=httpx.Timeout(OPENAI_TIMEOUT, connect=10.0),
+        )
+        _client = openai.AsyncOpenAI(http_client=http_client)
+        logger.info(f"Async OpenAI client created (http2={http2_available()}, "
+                    f"max_connections={OPENAI_MAX_CONNECTIONS}).")
+    return _client
+
+
+async def close_openai_client():
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
+        logger.info("Async OpenAI client closed.")
@@ -0,0 +1,99 @@
+import asyncio
+import logging
+
+from utils.metrics import STAGE_SECONDS
+
+logger = logging.getLogger('discord')
+
+# Statuses that hand control back to the caller
+ACTION_STATUSES = ("requires_action",)
+TERMINAL_STATUSES = ("completed", "failed", "expired", "cancelled", "incomplete")
+
+
+class RunDriver:
+    """
+    Drives an Assistants run until it needs tool outputs or reaches a terminal state.
+
+    When given an `on_text` callback the driver consumes the run's event stream:
+    text deltas are handed to the callback as they arrive and run status events
+    end the wait the moment they happen.
+
+    Otherwise it polls with adaptive exponential backoff: the first check happens
+    after `initial_interval` and each following delay grows by `backoff` up to
+    `max_interval`. Short runs are picked up within a few hundred milliseconds
+    while long runs don't hammer the API.
+    """
+
+    def __init__(self, client, initial_interval=0.1, max_interval=2.0, backoff=1.6, timeout=600.0):
+        self.client = client
+        self.initial_interval = initial_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.timeout = timeout
+
+    async def create(self, thread_id, assistant_id, on_text=None):
+        """Start a run and drive it to `requires_action` or a terminal status."""
+        if on_text is None:
+            with STAGE_SECONDS.time(stage="run_create"):
+                run = await self.client.beta.threads.runs.create(thread_id=thread_id, assistant_id=assistant_id)
+            with STAGE_SECONDS.time(stage="polling"):
+                return await self.wait(thread_id, run.id)
+        with STAGE_SECONDS.time(stage="run_create"):
+            events = await self.client.beta.threads.runs.create(thread_id=thread_id, assistant_id=assistant_id, stream=True)
+        with STAGE_SECONDS.time(stage="streaming"):
+            return await self.consume(thread_id, events, on_text)
+
+    async def submit_tool_outputs(self, thread_id, run_id, tool_outputs, on_text=None):
+        """Submit a round of tool outputs and drive the run to its next stop."""
+        if on_text is None:
+            with STAGE_SECONDS.time(stage="tool_submit"):
+                await self.client.beta.threads.runs.submit_tool_outputs(
+                    thread_id=thread_id, run_id=run_id, tool_outputs=tool_outputs)
+            with STAGE_SECONDS.time(stage="polling"):
+                return await self.wait(thread_id, run_id)
+        with STAGE_SECONDS.time(stage="tool_submit"):
+            events = await self.client.beta.threads.runs.submit_tool_outputs(
+                thread_id=thread_id, run_id=run_id, tool_outputs=tool_outputs, stream=True)
+        with STAGE_SECONDS.time(stage="streaming"):
+            return await self.consume(thread_id, events, on_text)
+
+    async def consume(self, thread_id, events, on_text):
+        """Read an Assistants event stream until the run needs action or finishes."""
+        run = None
+        try:
+            async for event in events:
+                if event.event == "thread.message.delta":
+                    for part in event.data.delta.content or []:
+                        if part.type == "text" and part.text and part.text.value:
+                            await on_text(part.text.value)
+                elif event.event.startswith("thread.run.") and not event.event.startswith("thread.run.step"):
+                    run = event.data
+                    if run.status in ACTION_STATUSES or run.status in TERMINAL_STATUSES:
+                        logger.info(f"Run {run.id} status: {run.status}")
+                        return run
+                elif event.event == "error":
+                    raise RuntimeError(f"Run stream error: {event.data}")
+        finally:
+            await events.close()
+
+        # The stream ended early; fall back to polling if we know which run it was
+        if run is None:
+            raise RuntimeError(f"Run stream for thread {thread_id} ended before the run started")
+        logger.warning(f"Run stream for {run.id} ended while {run.status}, polling instead.")
+        return await self.wait(thread_id, run.id)
+
+    async def wait(self, thread_id, run_id):
+        """Return the run once its status is `requires_action` or terminal."""
+        logger.info(f"Waiting on run {run_id} in thread {thread_id}")
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.timeout
+        interval = self.initial_interval
+        while True:
+            await asyncio.sleep(interval)
+            run = await self.client.beta.threads.runs.retrieve(thread_id=thread_id, run_id=run_id)
+            if run.status in ACTION_STATUSES or run.status in TERMINAL_STATUSES:
+                logger.info(f"Run {run_id} status: {run.status}")
+                return run
+            if loop.time() >= deadline:
+                raise asyncio.TimeoutError(f"Run {run_id} still {run.status} after {self.timeout}s")
+            interval = min(interval * self.backoff, self.max_interval)
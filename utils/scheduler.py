@@ -0,0 +1,143 @@
+import asyncio
+import logging
+import os
+from collections import deque
+
+from utils.metrics import STAGE_SECONDS
+
+logger = logging.getLogger('discord')
+
+CONVERSATION_IDLE_TIMEOUT = float(os.getenv('CONVERSATION_IDLE_TIMEOUT', '300'))
+COALESCE_WINDOW = float(os.getenv('COALESCE_WINDOW', '0'))  # Seconds of quiet that close a burst; 0 disables
+COALESCE_MAX_WAIT = float(os.getenv('COALESCE_MAX_WAIT', '4'))  # Longest a burst is held open
+COALESCE_MAX_MESSAGES = int(os.getenv('COALESCE_MAX_MESSAGES', '10'))
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, round(pct / 100 * (len(ordered) - 1)))]
+
+
+class ConversationScheduler:
+    """
+    Serialises work per conversation while sharing a global concurrency limit.
+
+    Each key (a user, who owns one OpenAI thread at a time) gets exactly one
+    long-lived worker that processes its queue in order, so two messages can
+    never start overlapping runs on the same thread. Workers exit after `idle_timeout` seconds without
+    work and their queues are dropped.
+
+    A worker takes the shared semaphore for one batch at a time and releases it
+    before taking the next. asyncio.Semaphore wakes waiters in FIFO order, so busy
+    conversations take turns with the others instead of holding on to a slot.
+
+    With a `coalesce_window`, items are debounced: the worker keeps collecting
+    until the conversation has been quiet for that long (at most `coalesce_max_wait`)
+    and also picks up anything that queued while the previous batch ran. The
+    handler then gets the whole burst at once. Without it every batch holds one item.
+    """
+
+    def __init__(self, handler, semaphore, idle_timeout=CONVERSATION_IDLE_TIMEOUT,
+                 coalesce_window=COALESCE_WINDOW, coalesce_max_wait=COALESCE_MAX_WAIT,
+                 coalesce_max_items=COALESCE_MAX_MESSAGES, wait_samples=1000):
+        self.handler = handler  # async handler(key, items)
+        self.semaphore = semaphore
+        self.idle_timeout = idle_timeout
+        self.coalesce_window = coalesce_window
+        self.coalesce_max_wait = coalesce_max_wait
+        self.coalesce_max_items = coalesce_max_items
+        self._queues = {}
+        self._workers = {}
+        self._wait_times = deque(maxlen=wait_samples)
+        self.processed = 0
+        self.batches = 0
+        self.evicted = 0
+
+    def submit(self, key, item):
+        queue = self._queues.get(key)
+        if queue is None:
+            queue = self._queues[key] = asyncio.Queue()
+        queue.put_nowait((asyncio.get_running_loop().time(), item))
+        if key not in self._workers:
+            self._workers[key] = asyncio.create_task(self._worker(key, queue))
+
+    async def _worker(self, key, queue):
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                try:
+                    first = await asyncio.wait_for(queue.get(), self.idle_timeout)
+                except asyncio.TimeoutError:
+                    if queue.empty():
+                        self.evicted += 1
+                        break
+                    continue
+                batch = [first]
+                if self.coalesce_window > 0:
+                    await self._debounce(queue, batch)
+                dequeued_at = loop.time()
+                for enqueued_at, _ in batch:
+                    STAGE_SECONDS.observe(dequeued_at - enqueued_at, stage="queue_wait")
+                async with self.semaphore:
+                    now = loop.time()
+                    STAGE_SECONDS.observe(now - dequeued_at, stage="semaphore_wait")
+                    if self.coalesce_window > 0:
+                        # Messages that arrived while we waited for a slot join this run too
+                        while not queue.empty() and len(batch) < self.coalesce_max_items:
+                            enqueued_at, item = queue.get_nowait()
+                            STAGE_SECONDS.observe(now - enqueued_at, stage="queue_wait")
+                            batch.append((enqueued_at, item))
+                    self._wait_times.extend(now - enqueued_at for enqueued_at, _ in batch)
+                    try:
+                        await self.handler(key, [item for _, item in batch])
+                    except Exception as e:
+                        logger.error(f"Unhandled error in worker for {key}: {e}")
+                    finally:
+                        self.processed += len(batch)
+                        self.batches += 1
+                        for _ in batch:
+                            queue.task_done()
+        finally:
+            # Nothing can be submitted between the empty check and here
+            self._queues.pop(key, None)
+            self._workers.pop(key, None)
+
+    async def _debounce(self, queue, batch):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.coalesce_max_wait
+        while len(batch) < self.coalesce_max_items:
+            timeout = min(self.coalesce_window, deadline - loop.time())
+            if timeout <= 0:
+                return
+            try:
+                batch.append(await asyncio.wait_for(queue.get(), timeout))
+            except asyncio.TimeoutError:
+                return
+
+    def queue_depth(self, key=None):
+        if key is not None:
+            queue = self._queues.get(key)
+            return queue.qsize() if queue else 0
+        # Called from the metrics thread too; copy before iterating as workers come and go
+        return sum(queue.qsize() for queue in list(self._queues.values()))
+
+    def stats(self):
+        waits = list(self._wait_times)
+        return {
+            "active_conversations": len(self._workers),
+            "queued_messages": self.queue_depth(),
+            "processed": self.processed,
+            "batches": self.batches,
+            "evicted": self.evicted,
+            "wait_p50": percentile(waits, 50),
+            "wait_p95": percentile(waits, 95),
+            "wait_max": max(waits, default=0.0),
+        }
+
+    async def close(self):
+        workers = list(self._workers.values())
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
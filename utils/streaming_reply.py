@@ -0,0 +1,78 @@
+import asyncio
+import logging
+import os
+
+from utils.discord_sender import split_message
+
+logger = logging.getLogger('discord')
+
+STREAM_EDIT_INTERVAL = float(os.getenv('STREAM_EDIT_INTERVAL', '1.2'))  # Seconds between edits of a message
+
+
+class StreamingReply:
+    """
+    Delivers an assistant reply to a channel while it's being generated.
+
+    The first text is sent as soon as it arrives; after that the message is edited
+    in place at most once per `edit_interval`. Sends and edits go through the sender's
+    per-channel buckets, so we stay inside Discord's rate limits. Once the text passes
+    the 2000-character limit the overflow continues in a new message.
+
+    `started_at` (event loop time, default now) is where time_to_first_token counts from.
+    """
+
+    def __init__(self, channel, sender, edit_interval=STREAM_EDIT_INTERVAL, started_at=None):
+        self.channel = channel
+        self.sender = sender
+        self.edit_interval = edit_interval
+        self.text = ""
+        self.messages = []  # Sent discord messages, in order
+        self._shown = []  # Content currently displayed in each message
+        self._lock = asyncio.Lock()
+        self._flush_task = None
+        self._last_flush = 0.0
+        self.started_at = asyncio.get_running_loop().time() if started_at is None else started_at
+        self.first_visible_at = None
+
+    @property
+    def time_to_first_token(self):
+        if self.first_visible_at is None:
+            return None
+        return self.first_visible_at - self.started_at
+
+    async def feed(self, delta):
+        self.text += delta
+        if not self.text.strip():
+            return  # Discord rejects blank messages; wait for visible text
+        if not self.messages:
+            # Show something to the user right away
+            await self._flush()
+        elif self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        loop = asyncio.get_running_loop()
+        await asyncio.sleep(max(0.0, self._last_flush + self.edit_interval - loop.time()))
+        self._flush_task = None
+        await self._flush()
+
+    async def _flush(self):
+        async with self._lock:
+            for index, chunk in enumerate(split_message(self.text)):
+                if index < len(self.messages):
+                    if self._shown[index] != chunk:
+                        await self.sender.edit_chunk(self.channel, self.messages[index], chunk)
+                        self._shown[index] = chunk
+                else:
+                    self.messages.append(await self.sender.send_chunk(self.channel, chunk))
+                    self._shown.append(chunk)
+                    if self.first_visible_at is None:
+                        self.first_visible_at = asyncio.get_running_loop().time()
+            self._last_flush = asyncio.get_running_loop().time()
+
+    async def finish(self):
+        """Write out whatever hasn't been shown yet."""
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        await self._flush()
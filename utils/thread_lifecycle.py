@@ -0,0 +1,67 @@
+import logging
+import os
+import time
+
+logger = logging.getLogger('discord')
+
+THREAD_MAX_MESSAGES = int(os.getenv('THREAD_MAX_MESSAGES', '200'))  # User + assistant messages per thread
+THREAD_MAX_CONTEXT_TOKENS = int(os.getenv('THREAD_MAX_CONTEXT_TOKENS', '24000'))  # Prompt tokens per model step of the last run
+THREAD_IDLE_SECONDS = float(os.getenv('THREAD_IDLE_SECONDS', str(3 * 24 * 60 * 60)))
+SUMMARY_MODEL = os.getenv('THREAD_SUMMARY_MODEL', 'gpt-4o-mini')
+SUMMARY_MESSAGES = int(os.getenv('THREAD_SUMMARY_MESSAGES', '30'))  # Most recent messages summarised
+SUMMARY_INPUT_CHARS = 24000
+
+SUMMARY_PROMPT = (
+    "Summarise this conversation between a user and an assistant in at most 150 words. "
+    "Keep facts about the user, their preferences, open questions and anything the assistant promised. "
+    "Write it as notes the assistant can pick the conversation up from."
+)
+
+
+class ThreadPolicy:
+    """
+    Decides when a user's thread should be replaced by a fresh one.
+
+    Every run re-reads the whole thread, so a thread that keeps growing makes each
+    reply slower and more expensive. Past THREAD_MAX_MESSAGES, THREAD_MAX_CONTEXT_TOKENS
+    or THREAD_IDLE_SECONDS of inactivity, the conversation rolls over to a new thread
+    seeded with a summary of the old one.
+    """
+
+    def __init__(self, max_messages=THREAD_MAX_MESSAGES, max_context_tokens=THREAD_MAX_CONTEXT_TOKENS,
+                 idle_seconds=THREAD_IDLE_SECONDS):
+        self.max_messages = max_messages
+        self.max_context_tokens = max_context_tokens
+        self.idle_seconds = idle_seconds
+
+    def rollover_reason(self, stats, now=None):
+        """Why the thread with these stats should roll over, or None to keep it."""
+        if stats is None:
+            return None  # Threads from before stats were kept start being tracked now
+        now = time.time() if now is None else now
+        if stats["messages"] >= self.max_messages:
+            return f"{stats['messages']} messages"
+        if stats["context_tokens"] >= self.max_context_tokens:
+            return f"{stats['context_tokens']} context tokens"
+        if now - stats["last_active"] >= self.idle_seconds:
+            return f"idle for {(now - stats['last_active']) / 3600:.0f}h"
+        return None
+
+
+async def summarize_thread(client, thread_id, max_messages=SUMMARY_MESSAGES, model=SUMMARY_MODEL):
+    """Summarise the most recent messages of a thread; returns None if there's nothing to carry over."""
+    page = await client.beta.threads.messages.list(thread_id=thread_id, order="desc", limit=max_messages)
+    lines = []
+    for message in reversed(page.data):
+        text = " ".join(part.text.value for part in message.content if getattr(part, "text", None))
+        if text:
+            lines.append(f"{message.role}: {text}")
+    transcript = "\n".join(lines)[-SUMMARY_INPUT_CHARS:]
+    if not transcript:
+        return None
+    response = await client.chat.completions.create(
+        model=model,
+        messages=[{"role": "system", "content": SUMMARY_PROMPT}, {"role": "user", "content": transcript}],
+        max_tokens=300,
+    )
+    return response.choices[0].message.content
@@ -0,0 +1,97 @@
+import asyncio
+import json
+import logging
+import os
+import time
+
+from utils.metrics import STAGE_SECONDS, TOOL_SECONDS
+
+logger = logging.getLogger('discord')
+
+TOOL_TIMEOUT = float(os.getenv('TOOL_TIMEOUT', '60'))
+TOOL_CONCURRENCY = int(os.getenv('TOOL_CONCURRENCY', '16'))
+
+
+def _being_cancelled():
+    """Whether the current task itself has been asked to cancel (Python 3.11+; assumed so before)."""
+    task = asyncio.current_task()
+    cancelling = getattr(task, "cancelling", None)
+    return cancelling is None or cancelling() > 0
+
+
+def parse_limits(spec, cast=int):
+    """Parse "name=value,name=value" into a dict, e.g. TOOL_CONCURRENCY_LIMITS."""
+    limits = {}
+    for item in (spec or "").split(","):
+        if "=" in item:
+            name, value = item.split("=", 1)
+            limits[name.strip()] = cast(value.strip())
+    return limits
+
+
+class ToolExecutor:
+    """
+    Runs the tool calls of a `requires_action` round concurrently.
+
+    Every call gets its own timeout and error isolation: a failing or slow tool
+    produces an error output for its own tool_call_id and never sinks the others.
+    Each tool also has a process-wide concurrency cap, so a heavy tool such as
+    image generation can't occupy every slot across conversations. With a
+    `compactor`, outputs are cut down to their size budget before submission.
+    """
+
+    def __init__(self, function_mapping, timeout=TOOL_TIMEOUT, timeouts=None,
+                 default_concurrency=TOOL_CONCURRENCY, concurrency=None, compactor=None):
+        self.function_mapping = function_mapping
+        self.compactor = compactor
+        self.timeout = timeout
+        self.timeouts = timeouts or {}
+        concurrency = concurrency or {}
+        self.semaphores = {
+            name: asyncio.Semaphore(concurrency.get(name, default_concurrency))
+            for name in function_mapping
+        }
+
+    async def call(self, function_name, arguments):
+        """Call a single tool under its concurrency cap and timeout."""
+        function_to_call = self.function_mapping[function_name]
+        timeout = self.timeouts.get(function_name, self.timeout)
+        async with self.semaphores[function_name]:
+            return await asyncio.wait_for(function_to_call(**arguments), timeout)
+
+    async def run_tool_call(self, tool_call):
+        function_name = tool_call.function.name
+        started = time.perf_counter()
+        outcome = "ok"
+        try:
+            if function_name not in self.function_mapping:
+                raise ValueError(f"Unknown function {function_name}")
+            arguments = json.loads(tool_call.function.arguments)
+            logger.info(f"Function {function_name} with arguments {arguments} needs to be called.")
+            output = await self.call(function_name, arguments)
+            logger.info(f"Function {function_name} called successfully.")
+        except asyncio.TimeoutError:
+            timeout = self.timeouts.get(function_name, self.timeout)
+            logger.error(f"Function {function_name} timed out after {timeout}s.")
+            output = {"error": f"{function_name} timed out after {timeout} seconds"}
+            outcome = "timeout"
+        except asyncio.CancelledError:
+            if _being_cancelled():
+                raise
+            # Cancelled from inside the tool (e.g. a shared upstream call), not by our caller
+            logger.error(f"Function {function_name} was cancelled.")
+            output = {"error": f"{function_name} was cancelled"}
+            outcome = "error"
+        except Exception as e:
+            logger.error(f"Error calling function {function_name}: {e}")
+            output = {"error": str(e)}
+            outcome = "error"
+        TOOL_SECONDS.observe(time.perf_counter() - started, tool=function_name, outcome=outcome)
+        if self.compactor is not None:
+            return {"tool_call_id": tool_call.id, "output": self.compactor.compact(function_name, output)}
+        return {"tool_call_id": tool_call.id, "output": json.dumps(output)}
+
+    async def run(self, tool_calls):
+        """Execute all tool calls at once and return outputs in the original order."""
+        with STAGE_SECONDS.time(stage="tool_calls"):
+            return list(await asyncio.gather(*(self.run_tool_call(tool_call) for tool_call in tool_calls)))
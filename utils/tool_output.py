@@ -0,0 +1,92 @@
+import json
+import logging
+import os
+
+logger = logging.getLogger('discord')
+
+TOOL_OUTPUT_BUDGET = int(os.getenv('TOOL_OUTPUT_BUDGET', '8000'))  # Bytes of JSON per tool call
+SERIES_WINDOW = int(os.getenv('TOOL_SERIES_WINDOW', '12'))  # Most recent points kept of a time series
+MAX_SHRINK_STEPS = 8
+
+
+def recent_window(series, window=SERIES_WINDOW):
+    """Keep the last `window` rows of a column-wise series ({column: [values...]})."""
+    if not isinstance(series, dict):
+        return series
+    return {column: values[-window:] if isinstance(values, list) else values
+            for column, values in series.items()}
+
+
+def pick(mapping, fields):
+    """Keep only `fields` of `mapping`, in that order, skipping missing or empty ones."""
+    if not isinstance(mapping, dict):
+        return mapping
+    return {field: mapping[field] for field in fields if mapping.get(field) not in (None, "", [], {})}
+
+
+def _shrink(value, max_items, max_chars):
+    # Cut lists and dicts to their first `max_items` and strings to `max_chars`, recursively;
+    # a cut dict says how many keys it lost, e.g. a lookup across hundreds of tickers
+    if isinstance(value, dict):
+        shrunk = {key: _shrink(item, max_items, max_chars) for key, item in list(value.items())[:max_items]}
+        if len(value) > max_items:
+            shrunk["_omitted_keys"] = len(value) - max_items
+        return shrunk
+    if isinstance(value, list):
+        return [_shrink(item, max_items, max_chars) for item in value[:max_items]]
+    if isinstance(value, str) and len(value) > max_chars:
+        return value[:max_chars] + "..."
+    return value
+
+
+def _encode(value):
+    return json.dumps(value, default=str, separators=(",", ":"))
+
+
+class OutputCompactor:
+    """
+    Fits each tool result into a size budget before it is submitted to the run.
+
+    A per-tool pruner first drops the fields we never use and trims time series to
+    their recent window. If the JSON is still over budget, lists, dicts and long
+    strings are cut down step by step until it fits, and the output is marked
+    truncated so the model knows it's seeing part of the data. The result is never
+    longer than the budget.
+    """
+
+    def __init__(self, budget=TOOL_OUTPUT_BUDGET, budgets=None, pruners=None):
+        self.budget = budget
+        self.budgets = budgets or {}
+        self.pruners = pruners or {}
+
+    def compact(self, function_name, output):
+        """Return `output` as a JSON string that fits the tool's budget."""
+        if isinstance(output, dict) and "error" in output:
+            return _encode(output)
+        raw_size = len(_encode(output))
+        pruner = self.pruners.get(function_name)
+        if pruner is not None:
+            try:
+                output = pruner(output)
+            except Exception as e:
+                logger.warning(f"Failed to prune {function_name} output: {e}")
+        encoded = _encode(output)
+
+        budget = self.budgets.get(function_name, self.budget)
+        max_items, max_chars = 50, 2000
+        steps = 0
+        while len(encoded) > budget and steps < MAX_SHRINK_STEPS:
+            shrunk = _shrink(output, max_items, max_chars)
+            encoded = _encode({"truncated": True, "data": shrunk})
+            max_items, max_chars = max(1, max_items // 2), max(80, max_chars // 2)
+            steps += 1
+        if len(encoded) > budget:
+            # Deeply nested data can outlast every step; say so rather than cut JSON mid-token
+            encoded = _encode({"truncated": True, "note": f"{function_name} returned {raw_size} bytes, "
+                                                          f"too much to include within {budget}"})
+            if len(encoded) > budget:
+                encoded = _encode({"truncated": True})
+
+        if len(encoded) < raw_size:
+            logger.info(f"Output of {function_name} compacted from {raw_size} to {len(encoded)} bytes.")
+        return encoded
@@ -0,0 +1,86 @@
+import asyncio
+import importlib
+import logging
+import time
+
+logger = logging.getLogger('discord')
+
+
+def _resolve(module, attribute):
+    return getattr(importlib.import_module(module), attribute)
+
+
+class ToolSpec:
+    """Where a tool lives: `module` holds the async function `name` and, optionally, its output pruner."""
+
+    def __init__(self, module, function=None, pruner=None):
+        self.module = module
+        self.function = function
+        self.pruner = pruner
+
+
+class LazyTool:
+    """
+    Async callable standing in for a tool until it's first used.
+
+    The tool's module, and with it heavy dependencies such as pandas, is imported
+    on a worker thread on the first call (or by prewarming), not at start-up.
+    """
+
+    def __init__(self, name, spec):
+        self.name = name
+        self.spec = spec
+        self._function = None
+
+    @property
+    def loaded(self):
+        return self._function is not None
+
+    async def load(self):
+        if self._function is None:
+            started = time.perf_counter()
+            self._function = await asyncio.to_thread(_resolve, self.spec.module, self.spec.function or self.name)
+            logger.info(f"Tool {self.name} loaded from {self.spec.module} in {time.perf_counter() - started:.2f}s.")
+        return self._function
+
+    async def __call__(self, **arguments):
+        function = self._function or await self.load()
+        return await function(**arguments)
+
+
+class LazyPruner:
+    """Output pruner resolved on first use; its module is already loaded by the tool that produced the output."""
+
+    def __init__(self, module, attribute):
+        self.module = module
+        self.attribute = attribute
+        self._function = None
+
+    def __call__(self, output):
+        if self._function is None:
+            self._function = _resolve(self.module, self.attribute)
+        return self._function(output)
+
+
+class ToolRegistry:
+    """Declarative name -> ToolSpec table of the assistant's tools, loaded lazily."""
+
+    def __init__(self, specs):
+        self.tools = {name: LazyTool(name, spec) for name, spec in specs.items()}
+
+    def mapping(self):
+        """name -> async callable, for the ToolExecutor."""
+        return dict(self.tools)
+
+    def pruners(self):
+        return {name: LazyPruner(tool.spec.module, tool.spec.pruner)
+                for name, tool in self.tools.items() if tool.spec.pruner}
+
+    async def prewarm(self):
+        """Import every tool module in the background, one at a time, so first calls are warm."""
+        for tool in self.tools.values():
+            try:
+                await tool.load()
+            except Exception as e:
+                logger.error(f"Failed to prewarm tool {tool.name}: {e}")
+        logger.info("All tools prewarmed.")